@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+#
+"""
+    Lockstep batched version of simulator.py for running many games at once, e.g. every map against every opponent
+    for parameter tuning.
+
+    BatchGame keeps N independent games as stacked NumPy arrays (planets as (games, planets), fleets as
+    (games, fleet slots)) and advances all unfinished games one turn per vectorized time step: growth, fleet movement
+    and arrival battles follow the same rules as simulator.Game and PlayGame. Bots still decide per game, through the
+    PlanetWars view of their game, and their orders are applied one at a time with the usual legality checks.
+
+    NumPy is required for this module only; simulator.py plays the same games without it.
+
+    usage: python batch_simulator.py <bot.py> [<opponent_bot.py> ...] [--maps N] [--max-turns T]
+"""
+import glob
+import logging
+import os
+import sys
+from functools import partial
+from time import perf_counter
+
+import numpy
+
+import simulator
+from planet_wars import PlanetWars, Planet, Fleet, distance_table, get_blackboard
+from simulator import MatchResult, SWAPPED_OWNER, play_turn
+
+_SWAPPED_OWNER = numpy.array(SWAPPED_OWNER)
+
+
+class BatchGame:
+    def __init__(self, maps, max_turns=1000):
+        """
+            maps is a list of (planets, fleets) pairs, one per game. Games with fewer planets than the largest are
+            padded with planets that belong to nobody and are never shown to the bots.
+        """
+        num_games = len(maps)
+        num_planets = max(len(planets) for planets, _ in maps)
+        self.max_turns = max_turns
+        self.num_planets = numpy.array([len(planets) for planets, _ in maps])
+        self.turn = numpy.zeros(num_games, dtype=numpy.int64)
+        self.active = numpy.ones(num_games, dtype=bool)
+
+        self.planet_x = numpy.zeros((num_games, num_planets))
+        self.planet_y = numpy.zeros((num_games, num_planets))
+        self.planet_owner = numpy.zeros((num_games, num_planets), dtype=numpy.int64)
+        self.planet_ships = numpy.zeros((num_games, num_planets), dtype=numpy.int64)
+        self.planet_growth = numpy.zeros((num_games, num_planets), dtype=numpy.int64)
+        self.distances = numpy.zeros((num_games, num_planets, num_planets), dtype=numpy.int64)
+        # Each game's distance_table result, handed to its player views: lockstep play cycles through more maps per
+        # turn than distance_table caches
+        self.tables = []
+        for game, (planets, _) in enumerate(maps):
+            count = len(planets)
+            _, self.planet_x[game, :count], self.planet_y[game, :count], self.planet_owner[game, :count], \
+                self.planet_ships[game, :count], self.planet_growth[game, :count] = zip(*planets)
+            self.tables.append(distance_table(tuple((p.x, p.y) for p in planets)))
+            flat = self.tables[game][0]
+            self.distances[game, :count, :count] = numpy.frombuffer(flat, dtype=numpy.intc).reshape(count, count)
+
+        # Fleet slots; live fleets are kept packed at the front of each row in launch order
+        capacity = max([16] + [2 * len(fleets) for _, fleets in maps])
+        self.fleet_owner = numpy.zeros((num_games, capacity), dtype=numpy.int64)
+        self.fleet_ships = numpy.zeros((num_games, capacity), dtype=numpy.int64)
+        self.fleet_source = numpy.zeros((num_games, capacity), dtype=numpy.int64)
+        self.fleet_destination = numpy.zeros((num_games, capacity), dtype=numpy.int64)
+        self.fleet_total = numpy.zeros((num_games, capacity), dtype=numpy.int64)
+        self.fleet_remaining = numpy.zeros((num_games, capacity), dtype=numpy.int64)
+        self.fleet_alive = numpy.zeros((num_games, capacity), dtype=bool)
+        self.num_fleets = numpy.zeros(num_games, dtype=numpy.int64)
+        for game, (_, fleets) in enumerate(maps):
+            for fleet in fleets:
+                self._add_fleet(game, *fleet)
+
+    @classmethod
+    def from_maps(cls, map_paths, max_turns=1000):
+        maps = []
+        for map_path in map_paths:
+            game = simulator.Game.from_map(map_path, max_turns)
+            maps.append((game.planets, game.fleets))
+        return cls(maps, max_turns)
+
+    def _fleet_arrays(self):
+        return (self.fleet_owner, self.fleet_ships, self.fleet_source, self.fleet_destination, self.fleet_total,
+                self.fleet_remaining, self.fleet_alive)
+
+    def _add_fleet(self, game, owner, num_ships, source, destination, total_trip_length, turns_remaining):
+        slot = self.num_fleets[game]
+        if slot == self.fleet_alive.shape[1]:
+            # Out of slots: double the capacity of every game
+            for name in ('fleet_owner', 'fleet_ships', 'fleet_source', 'fleet_destination', 'fleet_total',
+                         'fleet_remaining', 'fleet_alive'):
+                array = getattr(self, name)
+                setattr(self, name, numpy.concatenate([array, numpy.zeros_like(array)], axis=1))
+        self.fleet_owner[game, slot] = owner
+        self.fleet_ships[game, slot] = num_ships
+        self.fleet_source[game, slot] = source
+        self.fleet_destination[game, slot] = destination
+        self.fleet_total[game, slot] = total_trip_length
+        self.fleet_remaining[game, slot] = turns_remaining
+        self.fleet_alive[game, slot] = True
+        self.num_fleets[game] = slot + 1
+
+    def player_view(self, game, player_id):
+        """ Returns a PlanetWars state of one game as seen by the given player, which always calls itself player 1. """
+        count = self.num_planets[game]
+        owners = self.planet_owner[game, :count]
+        fleet_slots = self.fleet_alive[game].nonzero()[0]
+        fleet_owners = self.fleet_owner[game, fleet_slots]
+        if player_id == 2:
+            owners = _SWAPPED_OWNER[owners]
+            fleet_owners = _SWAPPED_OWNER[fleet_owners]
+        planets = [Planet(*fields) for fields in zip(range(count), self.planet_x[game, :count].tolist(),
+                                                     self.planet_y[game, :count].tolist(), owners.tolist(),
+                                                     self.planet_ships[game, :count].tolist(),
+                                                     self.planet_growth[game, :count].tolist())]
+        fleets = [Fleet(*fields) for fields in zip(fleet_owners.tolist(),
+                                                   self.fleet_ships[game, fleet_slots].tolist(),
+                                                   self.fleet_source[game, fleet_slots].tolist(),
+                                                   self.fleet_destination[game, fleet_slots].tolist(),
+                                                   self.fleet_total[game, fleet_slots].tolist(),
+                                                   self.fleet_remaining[game, fleet_slots].tolist())]
+        return PlanetWars.from_objects(planets, fleets, output=None, tables=self.tables[game])
+
+    def issue_order(self, game, player_id, source_planet_ID, destination_planet_ID, fleet_num_ships):
+        """ Launches a fleet for a player in one game. Returns False for an illegal order, which drops the player. """
+        fleet_num_ships = int(fleet_num_ships)
+        count = self.num_planets[game]
+        if not (0 <= source_planet_ID < count and 0 <= destination_planet_ID < count):
+            return False
+        if self.planet_owner[game, source_planet_ID] != player_id or fleet_num_ships < 0 or \
+                fleet_num_ships > self.planet_ships[game, source_planet_ID]:
+            return False
+        self.planet_ships[game, source_planet_ID] -= fleet_num_ships
+        distance = self.distances[game, source_planet_ID, destination_planet_ID]
+        self._add_fleet(game, player_id, fleet_num_ships, source_planet_ID, destination_planet_ID, distance, distance)
+        return True
+
+    def do_time_step(self):
+        """ Advances every active game by one turn. """
+        active = self.active
+        # Growth happens before fleets land, on every non-neutral planet
+        self.planet_ships += self.planet_growth * ((self.planet_owner > 0) & active[:, None])
+
+        moving = self.fleet_alive & active[:, None]
+        self.fleet_remaining -= moving
+        landing = moving & (self.fleet_remaining <= 0)
+        if landing.any():
+            games, slots = landing.nonzero()
+            forces = numpy.zeros(self.planet_owner.shape + (3,), dtype=numpy.int64)
+            numpy.add.at(forces, (games, self.fleet_destination[games, slots], self.fleet_owner[games, slots]),
+                         self.fleet_ships[games, slots])
+            games, planets = forces.any(axis=2).nonzero()
+            battles = forces[games, planets]
+            owners = self.planet_owner[games, planets]
+            battles[numpy.arange(len(games)), owners] += self.planet_ships[games, planets]
+            # Same rules as planet_wars.resolve_battle: the largest force keeps the difference to the second largest,
+            # a tie for the lead leaves the planet with its owner and no ships
+            ranked = numpy.sort(battles, axis=1)
+            tie = ranked[:, 2] == ranked[:, 1]
+            self.planet_owner[games, planets] = numpy.where(tie, owners, battles.argmax(axis=1))
+            self.planet_ships[games, planets] = numpy.where(tie, 0, ranked[:, 2] - ranked[:, 1])
+            self.fleet_alive &= ~landing
+            self._compact()
+
+        self.turn += active
+
+    def _compact(self):
+        # Pack live fleets to the front of each row, keeping their order
+        order = numpy.argsort(~self.fleet_alive, axis=1, kind='stable')
+        for name in ('fleet_owner', 'fleet_ships', 'fleet_source', 'fleet_destination', 'fleet_total',
+                     'fleet_remaining', 'fleet_alive'):
+            setattr(self, name, numpy.take_along_axis(getattr(self, name), order, axis=1))
+        self.num_fleets = self.fleet_alive.sum(axis=1)
+
+    def num_ships(self, player_id):
+        """ Ships on planets and in flight for a player, per game. """
+        return (self.planet_ships * (self.planet_owner == player_id)).sum(axis=1) + \
+               (self.fleet_ships * (self.fleet_alive & (self.fleet_owner == player_id))).sum(axis=1)
+
+    def winners(self):
+        """ Per game: -1 while the game is running, 0 for a draw, otherwise the winning player ID. """
+        present = [(self.planet_owner == player_id).any(axis=1) |
+                   (self.fleet_alive & (self.fleet_owner == player_id)).any(axis=1) for player_id in (1, 2)]
+        ships = [self.num_ships(1), self.num_ships(2)]
+        by_ships = numpy.where(ships[0] > ships[1], 1, numpy.where(ships[1] > ships[0], 2, 0))
+        running = numpy.where(self.turn > self.max_turns, by_ships, -1)
+        return numpy.where(present[0] & present[1], running,
+                           numpy.where(present[0], 1, numpy.where(present[1], 2, 0)))
+
+
+def play_matches(matches, max_turns=1000, turn_time=1000):
+    """
+        Plays every (bot, opponent_bot, map_path) match in lockstep and returns their MatchResults in the same order.
+        The rules for timeouts, crashes and illegal orders are the same as simulator.play_match.
+    """
+    bots = [(simulator.load_bot(bot), simulator.load_bot(opponent_bot)) for bot, opponent_bot, _ in matches]
+    batch = BatchGame.from_maps([map_path for _, _, map_path in matches], max_turns)
+    get_blackboard().reset_game()
+
+    num_games = len(matches)
+    timed_out = [None] * num_games
+    crashed = [None] * num_games
+    max_turn_time = [[0.0, 0.0] for _ in range(num_games)]
+    winners = batch.winners()
+    final = [None] * num_games
+    while True:
+        for game in (winners >= 0).nonzero()[0].tolist():
+            if final[game] is None:
+                final[game] = winners[game]
+        batch.active = numpy.array([winner is None for winner in final])
+        if not batch.active.any():
+            break
+
+        for game in batch.active.nonzero()[0].tolist():
+            views = (batch.player_view(game, 1), batch.player_view(game, 2))
+            timed_out[game], crashed[game] = play_turn(bots[game], views, partial(batch.issue_order, game),
+                                                       max_turn_time[game], turn_time, int(batch.turn[game]))
+            dropped = crashed[game] or timed_out[game]
+            if dropped:
+                final[game] = 3 - dropped
+                batch.active[game] = False
+
+        batch.do_time_step()
+        winners = batch.winners()
+
+    return [MatchResult(int(final[game]), int(batch.turn[game]), timed_out[game], crashed[game],
+                        tuple(max_turn_time[game])) for game in range(num_games)]
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    options = {'--maps': None, '--max-turns': 1000}
+    for option in options:
+        if option in args:
+            index = args.index(option)
+            options[option] = int(args[index + 1])
+            del args[index:index + 2]
+    if not args:
+        print('usage: python batch_simulator.py <bot.py> [<opponent_bot.py> ...] [--maps N] [--max-turns T]')
+        sys.exit(1)
+    bot, opponents = args[0], args[1:] or sorted(glob.glob('opponent_bots/*.py'))
+    map_paths = sorted(glob.glob('maps/map*.txt'), key=lambda path: int(os.path.basename(path)[3:-4]))
+    map_paths = map_paths[:options['--maps']]
+    matches = [(bot, opponent, map_path) for opponent in opponents for map_path in map_paths]
+
+    logging.disable(logging.CRITICAL)
+    start = perf_counter()
+    results = play_matches(matches, options['--max-turns'])
+    for opponent in opponents:
+        games = [result for match, result in zip(matches, results) if match[1] == opponent]
+        print('%-32s %3d/%d wins' % (opponent, sum(1 for r in games if r.winner == 1), len(games)))
+    print('%d games in %.1f s' % (len(results), perf_counter() - start))
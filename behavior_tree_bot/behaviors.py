@@ -4,9 +4,29 @@ from typing import List
 import logging
 sys.path.insert(0, '../')
 from planet_wars import issue_order, get_blackboard, PlanetWars, Fleet, Planet
+import metrics
 # from utility_functions import *
 from math import floor
 
+
+def per_turn_cache(function):
+    """
+    Memoize a utility function on the state it is called with. Results are keyed on the arguments and the
+    state's version, which issue_order bumps, so a query made after an order is recomputed. Lists are returned
+    as copies so callers can still modify them.
+    """
+    @wraps(function)
+    def cached(state, *args, **kwargs):
+        key = (function, args, tuple(kwargs.items())) if kwargs else (function, args)
+        hit = state.query_cache.get(key)
+        if hit is not None and hit[0] == state.version:
+            result = hit[1]
+        else:
+            result = function(state, *args, **kwargs)
+            state.query_cache[key] = (state.version, result)
+        return list(result) if type(result) is list else result
+    return cached
+
 def attack_weakest_enemy_planet(state):
     logging.info('FUNCTION: Running function: Attack Weakest Enemy Planet')
     # (1) Find my strongest planet.
@@ -135,7 +155,7 @@ def defend_targeted_planets(state):
 
 def issue_capture_order(state):
     blackboard = get_blackboard()
-    order = blackboard.get("order", None)
+    order = blackboard.order
     if "order" is None:
         logging.error("Order is not set in issue_capture_order")
         return False
@@ -143,12 +163,72 @@ def issue_capture_order(state):
     if order.num_ships <= 0:
         return False
     result = issue_order(state, order.source_id, order.dest_id, order.num_ships)
+    metrics.count("capture_orders" if result else "failed_capture_orders")
     logging.info(f"Order issued?: {result}, {order}")
     return result
 
+# Lookahead tuning: targets considered, the share of free ships each candidate musters and the rollout cap per turn
+LOOKAHEAD_TARGETS = 5
+LOOKAHEAD_STRENGTHS = (0.5, 1.0)
+LOOKAHEAD_MAX_ROLLOUTS = 2000
+
+def lookahead_capture(state, time_slice, rollouts=None):
+    """
+    Evaluate the candidate capture plans from get_lookahead_candidates, along with doing nothing, by rolling the game
+    forward against a model opponent, and issue the best plan's orders.
+    The search runs for up to time_slice seconds, or for exactly rollouts rollouts if given, which makes the choice
+    deterministic (benchmark.py and replay.py use this).
+
+    Parameters:
+        state (PlanetWars): The current game state
+        time_slice (float): Seconds the rollouts may take, ignored when rollouts is given
+        rollouts (int, optional): A fixed number of rollouts to play instead of a time slice (default: None)
+
+    Returns:
+        bool: True if a plan was chosen and issued, False if holding was best or no plan was possible
+    """
+    logging.info('FUNCTION: Running function: Lookahead Capture')
+    candidates = get_lookahead_candidates(state)
+    if len(candidates) == 1:
+        return False
+    import rollout  # Only needed once there are plans to search, and slow to import at start-up
+    if rollouts is not None:
+        best, played = rollout.search(state, candidates, None, rollouts)
+    elif time_slice > 0:
+        best, played = rollout.search(state, candidates, time_slice, LOOKAHEAD_MAX_ROLLOUTS)
+    else:
+        return False
+    metrics.emit("lookahead", candidates=len(candidates), rollouts=played, best=best)
+    if best == 0:
+        return False
+    return all([issue_order(state, *order) for order in candidates[best]])
+
 
 #~~~~~~~~~~~~~~~~~~~~UTILITY FUNCTIONS - NOT BEHAVIORS!!~~~~~~~~~~~~~~~~~~~~
 
+# Aggregate queries switch to the NumPy view from PlanetWars.arrays() on states at least this large.
+# Below these sizes building the arrays costs more than the Python loops they replace.
+VECTORIZE_MIN_PLANETS = 64
+VECTORIZE_MIN_FLEETS = 256
+
+
+def get_total_ships(state: PlanetWars, player_id: int) -> int:
+    """
+    Parameters:
+        state (PlanetWars): The current game state
+        player_id (int): The ID of the player
+
+    Returns:
+        int: The number of ships the player has on planets and in flight
+    """
+    arrays = state.arrays() if len(state.fleets) >= VECTORIZE_MIN_FLEETS else None
+    if arrays is not None:
+        return arrays.planet_ships[arrays.planet_owner == player_id].sum().item() \
+             + arrays.fleet_ships[arrays.fleet_owner == player_id].sum().item()
+    return sum(planet.num_ships for planet in state.planets if planet.owner == player_id) \
+         + sum(fleet.num_ships for fleet in state.fleets if fleet.owner == player_id)
+
+
 def get_pinned_ships(state: PlanetWars, planet_id: int) -> int:
     """    
     Parameters:
@@ -159,7 +239,7 @@ def get_pinned_ships(state: PlanetWars, planet_id: int) -> int:
         int: The number of ships pinned by an attacking force
     """
     ship_count = state.planets[planet_id].num_ships
-    attacking_ships = sum(fleet.num_ships for fleet in state.enemy_fleets() if fleet.destination_planet == planet_id)
+    attacking_ships = sum(fleet.num_ships for fleet in state.fleets_to(planet_id, 2))
     return min(ship_count, attacking_ships)
 
 
@@ -179,10 +259,11 @@ def get_free_ships(state: PlanetWars, planet_id: int, percentage: float = 1) ->
     free_ships = total_ships - pinned_ships
     free_ships *= percentage
     free_ships = int(free_ships)
-    print(f"Free Ships on Planet {planet_id}: {free_ships}", file=open("log_test.txt", "w"), flush=True)
+    metrics.emit("free_ships", planet=planet_id, ships=free_ships)
     return max(free_ships, 0)
 
 
+@per_turn_cache
 def get_attacked_planets(state: PlanetWars) -> List[Planet]:
     """
     Parameters:
@@ -211,7 +292,8 @@ def get_planets(state: PlanetWars, planet_ids: List[int]) -> List[Planet]:
 def forecast_ship_count(state: PlanetWars, planet: Planet, num_turns: int) -> int:
     """
     Calculate the number of ships a planet will have in a number of turns.
-    This includes production and fleets in flight at the time of the function call.
+    This includes production and fleets in flight at the time of the function call, resolved with the engine's
+    battle rules. The ships belong to whoever forecast_planet_owner says owns the planet at that turn.
 
     Parameters:
         planet (Planet): The planet to forecast the ship count for.
@@ -219,87 +301,26 @@ def forecast_ship_count(state: PlanetWars, planet: Planet, num_turns: int) -> in
 
     Returns:
         int: The forecasted ship count for the planet.
-    """ 
-    ship_count = planet.num_ships
-    attacking_fleets = get_attacking_fleets(state, planet_id=planet.ID)
-    arriving_fleets = [fleet for fleet in attacking_fleets if fleet.turns_remaining <= num_turns]
-    
-    if not arriving_fleets:
-        return ship_count + planet.growth_rate * num_turns
-    
-    arriving_fleets.sort(key=lambda fleet: fleet.turns_remaining)
-    first_arrival = arriving_fleets[0].turns_remaining
-    
-    if (first_arrival > num_turns and planet.owner == 0) or num_turns <= 0:
-        return ship_count
-    
-    ally_ship_count = reduce(lambda a, b: a + b.num_ships, [f for f in arriving_fleets if f.owner == 1], 0)
-    enemy_ship_count = reduce(lambda a, b: a + b.num_ships, [f for f in arriving_fleets if f.owner == 2], 0)
-    if planet.owner == 0:
-        ship_count = abs(ship_count - abs(ally_ship_count - enemy_ship_count))
-    else:
-        ship_count += abs(ally_ship_count - enemy_ship_count)
-    if planet.owner == 0:
-        ship_count += planet.growth_rate * (num_turns - first_arrival)
-    else:
-        ship_count += planet.growth_rate * num_turns
-    logging.info(f"UTILITY: Ship count acquired, {ship_count}")
-    return ship_count
+    """
+    return state.forecast(planet.ID).num_ships(num_turns)
 
 
-def forecast_planet_owner(state: PlanetWars, planet: Planet) -> int:
+def forecast_planet_owner(state: PlanetWars, planet: Planet, num_turns: int = None) -> int:
     """
-    Calculate the number of ships a planet will have in a number of turns.
-    This includes production and fleets in flight at the time of the function call.
+    Calculate who will own a planet once the fleets in flight at the time of the function call have landed,
+    or after num_turns turns if given.
 
     Parameters:
         planet (Planet): The planet to forecast.
+        num_turns (int, optional): The number of turns to forecast (default: until the last fleet lands)
 
     Returns:
-        int: The forecasted ship count for the planet.
+        int: The forecasted owner of the planet.
     """
-    ship_count = planet.num_ships
-    current_owner = planet.owner
-    attacking_fleets = get_attacking_fleets(state, planet_id=planet.ID)
-    arriving_fleets = [fleet for fleet in attacking_fleets]
-    arriving_fleets.sort(key=lambda fleet: fleet.turns_remaining, reverse=True)
-    logging.info(f"forecast_planet_owner: arriving_fleets {arriving_fleets}")
-    
-    if not arriving_fleets:
-        return planet.owner
-    
-    last_arrival = arriving_fleets[0].turns_remaining
-    for turn in range(last_arrival+1):
-        ship_count += planet.growth_rate if current_owner != 0 else 0
-        fleets = []
-        while arriving_fleets and arriving_fleets[-1].turns_remaining == turn:
-            fleets.append(arriving_fleets.pop())
-        ally_ship_count = reduce(lambda a, b: a + b.num_ships, [f for f in fleets if f.owner == 1], 0)
-        enemy_ship_count = reduce(lambda a, b: a + b.num_ships, [f for f in fleets if f.owner == 2], 0)
-        match current_owner:
-            case 0:
-                ship_count -= abs(ally_ship_count - enemy_ship_count)
-                if ship_count > 0:
-                    continue
-                elif ally_ship_count > enemy_ship_count:
-                    current_owner = 1
-                else:
-                    current_owner = 2
-            case 1:
-                ship_count += ally_ship_count
-                ship_count -= enemy_ship_count
-                if ship_count < 0:
-                    ship_count = abs(ship_count)
-                    current_owner = 2
-            case 2:
-                ship_count += enemy_ship_count
-                ship_count -= ally_ship_count
-                if ship_count < 0:
-                    ship_count = abs(ship_count)
-                    current_owner = 1
-
-    return current_owner
+    forecast = state.forecast(planet.ID)
+    return forecast.owner(forecast.horizon if num_turns is None else num_turns)
 
+@per_turn_cache
 def get_attacking_fleets(state: PlanetWars, planet_id: int) -> List[Fleet]:
     """
     Parameters:
@@ -311,16 +332,15 @@ def get_attacking_fleets(state: PlanetWars, planet_id: int) -> List[Fleet]:
     """
     owner = state.planets[planet_id].owner
     if owner == 2:
-        ally_fleets = state.my_fleets()
+        attacking_fleets = list(state.fleets_to(planet_id, 1))
     if owner == 1:
-        ally_fleets = state.enemy_fleets()
+        attacking_fleets = list(state.fleets_to(planet_id, 2))
     else:
-        dupl_fleets = state.my_fleets()
-        dupl_fleets.extend(state.enemy_fleets())
-        ally_fleets = dupl_fleets
-    attacking_fleets = [fleet for fleet in ally_fleets if fleet.destination_planet == planet_id]
+        attacking_fleets = list(state.fleets_to(planet_id, 1))
+        attacking_fleets.extend(state.fleets_to(planet_id, 2))
     return attacking_fleets
 
+@per_turn_cache
 def get_defending_fleets(state: PlanetWars, planet_id: int) -> List[Fleet]:
     """
     Returns a list of the ally fleets currently defending the given planet.
@@ -334,15 +354,15 @@ def get_defending_fleets(state: PlanetWars, planet_id: int) -> List[Fleet]:
     """
     owner = state.planets[planet_id].owner
     if owner == 1:
-        ally_fleets = state.my_fleets()
+        defending_fleets = state.fleets_to(planet_id, 1)
     if owner == 2:
-        ally_fleets = state.enemy_fleets()
+        defending_fleets = state.fleets_to(planet_id, 2)
     else:
         return [] #A neutral planet will have no defenders, only attackers :(
-    defending_fleets = [fleet for fleet in ally_fleets if fleet.destination_planet == planet_id]
-    return defending_fleets
+    return list(defending_fleets)
 
 
+@per_turn_cache
 def get_nearest_planets(state: PlanetWars, planet_id: int, num_turns: int=float('INF'), player_id: int = None) -> List[Planet]:
     """
     Return a sorted list of the nearest planets to a given planet.
@@ -359,14 +379,19 @@ def get_nearest_planets(state: PlanetWars, planet_id: int, num_turns: int=float(
         List[Planet]: A sorted list of nearest planets
     """
     logging.info("UTILITY: Getting nearest planets")
-    planet = None
-    assert planet_id in [p.ID for p in state.planets], "Planet ID not found in state"
-    planet = state.planets[planet_id]
-    planets = [p for p in state.planets if p.ID != planet_id and p.owner == player_id and state.distance(planet.ID, p.ID) <= num_turns]
-    planets.sort(key=lambda p: state.distance(planet.ID, p.ID))
+    assert 0 <= planet_id < len(state.planets), "Planet ID not found in state"
+    planets = []
+    # Neighbours are pre-sorted by distance, so stop at the first one past the horizon
+    for neighbour_id in state.neighbours(planet_id):
+        if state.distance(planet_id, neighbour_id) > num_turns:
+            break
+        neighbour = state.planets[neighbour_id]
+        if neighbour.owner == player_id:
+            planets.append(neighbour)
     return planets
 
 
+@per_turn_cache
 def get_weakest_planets(state: PlanetWars, player_id: int, planet_id: int = None, cutoff: int = float('INF')) -> List[Planet]:
     """
     Return a list of planets owned by a player that have under the cutoff number of ships, sorted with the weakest first.
@@ -380,6 +405,18 @@ def get_weakest_planets(state: PlanetWars, player_id: int, planet_id: int = None
     Returns:
         List[Planet]: A sorted list of weakest planets owned by the player
     """
+    arrays = state.arrays() if len(state.planets) >= VECTORIZE_MIN_PLANETS else None
+    if arrays is not None:
+        mask = (arrays.planet_owner == player_id) & (arrays.planet_ships <= cutoff)
+        if planet_id:
+            mask[planet_id] = False
+            keys = arrays.distances[planet_id] * 2 + arrays.planet_ships
+        else:
+            keys = arrays.planet_ships
+        candidates = mask.nonzero()[0]
+        # Stable sort keeps ties in planet ID order, same as list.sort below
+        return [state.planets[i] for i in candidates[keys[candidates].argsort(kind='stable')].tolist()]
+
     if planet_id:
         planets = [p for p in state.planets if p.owner == player_id and p.ID != planet_id and p.num_ships <= cutoff]
         planets.sort(key=lambda p: (state.distance(planet_id, p.ID) * 2 + p.num_ships))
@@ -389,6 +426,7 @@ def get_weakest_planets(state: PlanetWars, player_id: int, planet_id: int = None
     return planets
 
 
+@per_turn_cache
 def get_strongest_planets(state: PlanetWars, player_id: int, planet_id: int = None, cutoff: int = float('INF')) -> List[Planet]:
     """
     Return a list of planets owned by a player that have under the cutoff number of ships, sorted with the strongest first.
@@ -405,6 +443,7 @@ def get_strongest_planets(state: PlanetWars, player_id: int, planet_id: int = No
     return get_weakest_planets(state, player_id, planet_id, cutoff)[::-1]
 
 
+@per_turn_cache
 def max_reinforcements(state: PlanetWars, planet_id: int, num_turns: int) -> int:
     """
     Calculate the maximum amount of reinforcements that a planet can receive in a given number of turns.
@@ -419,12 +458,66 @@ def max_reinforcements(state: PlanetWars, planet_id: int, num_turns: int) -> int
         int: The maximum amount of reinforcements that the planet can receive including growth rate and ships in flight
     """
     reinforcements = forecast_ship_count(state, state.planets[planet_id], num_turns)
-    for p in state.planets:
-        if p.ID != planet_id and state.distance(planet_id, p.ID) <= num_turns:
-            reinforcements += forecast_ship_count(state, p, num_turns - state.distance(planet_id, p.ID))
+    for neighbour_id in state.neighbours(planet_id):
+        distance = state.distance(planet_id, neighbour_id)
+        if distance > num_turns:
+            break
+        reinforcements += forecast_ship_count(state, state.planets[neighbour_id], num_turns - distance)
     return reinforcements
 
 
+def get_lookahead_candidates(state: PlanetWars) -> List[List[tuple]]:
+    """
+    Return the order sets the lookahead chooses between: holding (no orders) first, then a capture plan at each of
+    LOOKAHEAD_STRENGTHS for the LOOKAHEAD_TARGETS most productive planets we do not own.
+
+    Parameters:
+        state (PlanetWars): The current game state
+
+    Returns:
+        List[List[tuple]]: Candidate lists of (source, destination, num_ships) orders, starting with the empty list
+    """
+    candidates = [[]]
+    targets = sorted(state.not_my_planets(), key=lambda p: get_production_factor(state, p.ID), reverse=True)
+    for target in targets[:LOOKAHEAD_TARGETS]:
+        for strength in LOOKAHEAD_STRENGTHS:
+            orders = plan_capture(state, target, strength)
+            if orders and orders not in candidates:
+                candidates.append(orders)
+    return candidates
+
+
+def plan_capture(state: PlanetWars, target: Planet, strength: float = 1) -> List[tuple]:
+    """
+    Plan the orders that capture a planet, mustering free ships from our planets nearest to it first.
+
+    Parameters:
+        state (PlanetWars): The current game state
+        target (Planet): The planet to capture
+        strength (float, optional): The share of each planet's free ships that may be sent (default: 1)
+
+    Returns:
+        List[tuple]: (source, destination, num_ships) orders, or an empty list if we cannot muster enough ships
+    """
+    orders = []
+    sent = 0
+    arrival = 0
+    for ally in get_nearest_planets(state, target.ID, player_id=1):
+        distance = state.distance(ally.ID, target.ID)
+        arrival = max(arrival, distance)
+        if forecast_planet_owner(state, target, arrival) == 1:
+            return []
+        needed = forecast_ship_count(state, target, arrival) + 1 - sent
+        num_ships = min(get_free_ships(state, ally.ID, strength), needed)
+        if num_ships <= 0:
+            continue
+        orders.append((ally.ID, target.ID, num_ships))
+        sent += num_ships
+        if sent > forecast_ship_count(state, target, arrival):
+            return orders
+    return []
+
+
 def get_production_factor(state: PlanetWars, planet_id: int) -> float:
     """
     Return the production value of this planet. The production value is a ratio based on the growth_rate of the planet and the number of ships guarding it.
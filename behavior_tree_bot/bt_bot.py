@@ -6,18 +6,23 @@
 // starting point, or you can throw it out entirely and replace it with your
 // own.
 """
-import logging, traceback, sys, os, inspect
-logging.basicConfig(filename=__file__[:-3] +'.log', filemode='w', level=logging.DEBUG)
-currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+import logging, traceback, sys, os
+# Logging is configured in __main__ only, so importing the bot (simulator.py, bot_server.py) stays cheap
+currentdir = os.path.dirname(os.path.abspath(__file__))
 parentdir = os.path.dirname(currentdir)
 sys.path.append(parentdir)
+if currentdir not in sys.path:
+    sys.path.insert(0, currentdir)
 from collections import namedtuple
 
-from behavior_tree_bot.behaviors import *
-from behavior_tree_bot.checks import *
-from behavior_tree_bot.bt_nodes import *
+# Imported by their plain names, the same as checks.py imports behaviors, so each module is only loaded once
+from behaviors import *
+from checks import *
+from bt_nodes import *
 
-from planet_wars import PlanetWars, finish_turn, get_blackboard
+from planet_wars import GameStateReader, GameRecorder, finish_turn, get_blackboard
+from time import perf_counter
+import metrics
 
 # You have to improve this tree or create an entire new one that is capable
 # of winning against all the 5 opponent bots
@@ -38,11 +43,11 @@ def setup_behavior_tree():
         Succeeder(UntilFailure(
             Sequence([
                 PopFromStack(blackboard, "strongest_ally_planets", "muster_ally"),
-                Check(lambda state, blackboard: get_free_ships(state, blackboard["muster_ally"].ID) > 0, blackboard),
+                Check(lambda state, blackboard: get_free_ships(state, blackboard.muster_ally.ID) > 0, blackboard),
                 # Stop planning orders once we have enough ships to capture
                 Check(
-                    lambda state, blackboard: blackboard["attack_strength"] < capture_buffer + \
-                        forecast_ship_count(state, blackboard["capture_target"], blackboard["attack_max_arrival_time"]),
+                    lambda state, blackboard: blackboard.attack_strength < capture_buffer + \
+                        forecast_ship_count(state, blackboard.capture_target, blackboard.attack_max_arrival_time),
                     blackboard
                 ),
                 Sequence(name="Setting Order Variables", child_nodes=[
@@ -51,43 +56,43 @@ def setup_behavior_tree():
                         "order", 
                         lambda state: \
                             Order(
-                                max(0, min(get_free_ships(state, blackboard["muster_ally"].ID, muster_phaser_strength), \
+                                max(0, min(get_free_ships(state, blackboard.muster_ally.ID, muster_phaser_strength), \
                                     forecast_ship_count(
-                                        state, blackboard["capture_target"], 
-                                        state.distance(blackboard["capture_target"].ID, 
-                                        blackboard["muster_ally"].ID)
-                                    ) - blackboard["attack_strength"] + capture_buffer)),
-                                blackboard["muster_ally"].ID,
-                                blackboard['capture_target'].ID,
-                                state.distance(blackboard["muster_ally"].ID, blackboard['capture_target'].ID)
+                                        state, blackboard.capture_target, 
+                                        state.distance(blackboard.capture_target.ID, 
+                                        blackboard.muster_ally.ID)
+                                    ) - blackboard.attack_strength + capture_buffer)),
+                                blackboard.muster_ally.ID,
+                                blackboard.capture_target.ID,
+                                state.distance(blackboard.muster_ally.ID, blackboard.capture_target.ID)
                             )
                     ),
                     SetVar(
                         blackboard,
                         "attack_strength", 
-                        lambda state: blackboard["attack_strength"] + blackboard["order"].num_ships
+                        lambda state: blackboard.attack_strength + blackboard.order.num_ships
                     ),
                     SetVar(
                         blackboard,
                         "attack_max_arrival_time", 
-                        lambda state: max(blackboard["attack_max_arrival_time"], blackboard["order"].arrival_time)
+                        lambda state: max(blackboard.attack_max_arrival_time, blackboard.order.arrival_time)
                     )
                 ]),
                 PushToStack(blackboard, "orders", "order")
             ]),
         )),
         # Check to ensure that at least one order has been added
-        Check(lambda state, blackboard: len(blackboard["orders"]) > 0, blackboard),
+        Check(lambda state, blackboard: len(blackboard.orders) > 0, blackboard),
         # Check to ensure that we mustered enough force
         Check(
-            lambda state, blackboard: blackboard["attack_strength"] > \
-                forecast_ship_count(state, blackboard["capture_target"], blackboard["attack_max_arrival_time"]),
+            lambda state, blackboard: blackboard.attack_strength > \
+                forecast_ship_count(state, blackboard.capture_target, blackboard.attack_max_arrival_time),
             blackboard
         )
     ])
     order_sequence = Sequence(name="Order Sequence", child_nodes=[
         # Reverse stack to use best planets first
-        SetVar(blackboard, "orders", lambda state: blackboard["orders"][::-1]),
+        SetVar(blackboard, "orders", lambda state: blackboard.orders[::-1]),
         UntilFailure(
             Sequence(name="Issue Order Sequence", child_nodes=[
                 PopFromStack(blackboard, "orders", "order"),
@@ -109,7 +114,7 @@ def setup_behavior_tree():
                     blackboard, 
                     "strongest_ally_planets", 
                     # Reverse so best are at top of stack
-                    lambda state: get_strongest_planets(state, 1, blackboard["capture_target"].ID)[::-1],
+                    lambda state: get_strongest_planets(state, 1, blackboard.capture_target.ID)[::-1],
                 ),
                 muster_sequence,
                 order_sequence
@@ -174,7 +179,7 @@ def setup_behavior_tree():
         # 2. If the steal fails it will try again with the next possibly stealable planet
         # 3. If it succeeds it will still try to steal more planets if possible since its high-reward low-risk
         Succeeder(Sequence([
-            SetVar(blackboard, "capture_target", lambda state: blackboard["attacked_neutral_planet"]), # Set so it can be tested in Check as it expects it
+            SetVar(blackboard, "capture_target", lambda state: blackboard.attacked_neutral_planet), # Set so it can be tested in Check as it expects it
             Inverter(Check(will_planet_be_captured_by_us)),
             capture_stealable_planet
         ]))
@@ -182,41 +187,87 @@ def setup_behavior_tree():
     # continue_until_success
     capture_stealable_planet.child_nodes = [
         Check(is_planet_stealable, blackboard), #Check if the planet is valid to be stolen. If not, we dip to the next iteration.
-        SetVar(blackboard, "capture_target", lambda state: blackboard["attacked_neutral_planet"]), #Setting capture_target to planet to steal
+        SetVar(blackboard, "capture_target", lambda state: blackboard.attacked_neutral_planet), #Setting capture_target to planet to steal
         capture_sequence
         # UntilFailure(Action(steal_targeted_neutral_planet)) #For now, just try to steal it until we can't anymore.
     ]
 
+    # When the heuristic strategies issued nothing this turn, roll candidate captures forward and take the best one
+    # (if any beats holding)
+    lookahead = Sequence(name='Lookahead Fallback', child_nodes=[
+        Check(no_orders_issued),
+        Action(lambda state: lookahead_capture(state, min(LOOKAHEAD_SLICE, time_left()), LOOKAHEAD_ROLLOUTS))
+    ])
+
     # root.child_nodes = [offensive_plan, spread_sequence, defense_sequence]
-    root.child_nodes = [steal_sequence, offensive_plan]
+    root.child_nodes = [steal_sequence, offensive_plan, lookahead]
     # root.child_nodes = [steal_sequence, spread_sequence, repeat_defense_strategy]
 
 
-    logging.info('\n' + root.tree_to_string())
     return root
 
+behavior_tree = None
+# Seconds the tree may run each turn. PlayGame allows 1000 ms, the rest covers parsing and sending orders.
+TURN_BUDGET = 0.8
+# Seconds of that budget the lookahead may spend on rollouts
+LOOKAHEAD_SLICE = 0.1
+# A fixed rollout count makes the lookahead deterministic instead of time-sliced, e.g. BT_LOOKAHEAD_ROLLOUTS=200
+# when recording a game for replay.py
+LOOKAHEAD_ROLLOUTS = int(os.environ['BT_LOOKAHEAD_ROLLOUTS']) if os.environ.get('BT_LOOKAHEAD_ROLLOUTS') else None
+
 # You don't need to change this function
 def do_turn(state):
-    behavior_tree.execute(planet_wars)
+    global behavior_tree
+    # Built lazily so the bot can also be imported and played in-process by simulator.py
+    if behavior_tree is None:
+        behavior_tree = compile_tree(setup_behavior_tree())
+    get_blackboard().reset_turn()
+    set_deadline(TURN_BUDGET)
+    behavior_tree(state)
 
 if __name__ == '__main__':
-    logging.basicConfig(filename=__file__[:-3] + '.log', filemode='w', level=logging.DEBUG)
-    logging.log(logging.INFO, "Setting up behavior tree")
-    behavior_tree = setup_behavior_tree()
+    # BT_LOG_LEVEL=DEBUG (or INFO) restores the full per-turn log, which also describes the tree at start-up
+    logging.basicConfig(filename=__file__[:-3] + '.log', filemode='w',
+                        level=os.environ.get('BT_LOG_LEVEL', 'WARNING').upper())
+    logging.info("Setting up behavior tree")
+    root = setup_behavior_tree()
+    if logging.getLogger().isEnabledFor(logging.INFO):
+        logging.info('\n' + root.tree_to_string())
+    # BT_PROFILE=1 times every node; the report is written when the game ends
+    profiler = Profiler() if os.environ.get('BT_PROFILE', '0') not in ('', '0') else None
+    behavior_tree = compile_tree(root, profiler)
+    # BT_RECORD=1 records every state and its orders to bt_bot.record.jsonl (or BT_RECORD=<path>) for replay.py
+    record_path = os.environ.get('BT_RECORD', '0')
+    recorder = None
+    if record_path not in ('', '0'):
+        recorder = GameRecorder(__file__[:-3] + '.record.jsonl' if record_path == '1' else record_path)
     try:
-        map_data = ''
-        while True:
-            current_line = input()
-            if len(current_line) >= 2 and current_line.startswith("go"):
-                planet_wars = PlanetWars(map_data)
+        # BT_METRICS=1 writes the helpers' debug events and counters to bt_bot.metrics.jsonl once per turn
+        if os.environ.get('BT_METRICS', '0') not in ('', '0'):
+            metrics.configure(__file__[:-3] + '.metrics.jsonl')
+        for planet_wars in GameStateReader():
+            if recorder is not None:
+                recorder.start_turn(planet_wars)
+                start = perf_counter()
+            try:
                 do_turn(planet_wars)
-                finish_turn()
-                map_data = ''
-            else:
-                map_data += current_line + '\n'
+            except Exception:
+                # Keep the orders issued so far and stay in the game rather than forfeit it
+                logging.exception("Error in turn.")
+            finish_turn(planet_wars)
+            if recorder is not None:
+                recorder.end_turn(planet_wars, (perf_counter() - start) * 1000)
+            metrics.flush()
 
     except KeyboardInterrupt:
         print('ctrl-c, leaving ...')
     except Exception:
         traceback.print_exc(file=sys.stdout)
         logging.exception("Error in bot.")
+    finally:
+        if recorder is not None:
+            recorder.close()
+        if profiler is not None:
+            with open(__file__[:-3] + '.profile.txt', 'w') as f:
+                f.write(profiler.annotated_tree(root))
+            profiler.write_collapsed(__file__[:-3] + '.collapsed')
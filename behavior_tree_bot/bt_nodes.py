@@ -1,16 +1,148 @@
 from copy import deepcopy
+from time import perf_counter
+from types import FunctionType
 import logging
+import os
+
+# Node tracing is opt-in: run the bot with BT_TRACE=1 to log every node execution and blackboard write at DEBUG.
+# Otherwise log_execution returns execute undecorated, so the tree pays nothing for it.
+TRACE = os.environ.get('BT_TRACE', '0') not in ('', '0')
+
+# perf_counter() time after which composites stop starting children, see set_deadline
+_deadline = float('inf')
+
+
+def set_deadline(seconds):
+    """
+    Gives the tree a time budget from now, or removes it when seconds is None. Composites check the budget before
+    each child; once it has run out they fail instead of starting more work, so the tick unwinds quickly and the
+    orders issued so far stand. Set it at the start of every turn.
+    """
+    global _deadline
+    _deadline = float('inf') if seconds is None else perf_counter() + seconds
+
+
+def out_of_time():
+    return perf_counter() >= _deadline
+
+
+def time_left():
+    """ Seconds until the deadline set by set_deadline, never negative. """
+    return max(_deadline - perf_counter(), 0.0)
 
 
 def log_execution(fn):
+    if not TRACE:
+        return fn
+
     def logged_fn(self, state):
-        logging.debug('Executing:' + str(self))
+        if not logging.getLogger().isEnabledFor(logging.DEBUG):
+            return fn(self, state)
+        logging.debug('Executing: %s', self)
         result = fn(self, state)
-        logging.debug('Result: ' + str(self) + ' -> ' + ('Success' if result else 'Failure'))
+        logging.debug('Result: %s -> %s', self, 'Success' if result else 'Failure')
         return result
     return logged_fn
 
 
+def compile_tree(root, profiler=None):
+    """
+    Compiles a behavior tree into a single callable taking the state and returning success or failure, with the same
+    semantics as root.execute(state). Every node becomes a closure over its already-compiled children, so a tick runs
+    no attribute lookups or method dispatch.
+    The tree must not be restructured after compiling; recompile it instead.
+    Pass a Profiler to record per-node timings on every tick.
+    """
+    return root.compile(profiler)
+
+
+def _accepts_blackboard(function):
+    # Check, SetVar and Action callbacks take either (state) or (state, blackboard); two required positional
+    # parameters means the node passes its blackboard too
+    if type(function) is FunctionType:
+        return function.__code__.co_argcount - len(function.__defaults__ or ()) >= 2
+    import inspect  # Slow to import, so only for callables that are not plain functions
+    try:
+        parameters = inspect.signature(function).parameters.values()
+    except (TypeError, ValueError):
+        return False
+    required = [p for p in parameters if p.default is p.empty and
+                p.kind in (inspect.Parameter.POSITIONAL_ONLY, inspect.Parameter.POSITIONAL_OR_KEYWORD)]
+    return len(required) >= 2
+
+
+def _callback_name(function):
+    # Lambdas are told apart by where they are defined
+    name = getattr(function, '__name__', repr(function))
+    if name == '<lambda>':
+        code = function.__code__
+        name = '<lambda %s:%d>' % (os.path.basename(code.co_filename), code.co_firstlineno)
+    return name
+
+
+class Profiler:
+    """
+    Opt-in per-node profiler for compiled trees. For every node it records call count, successes, cumulative wall time
+    and self time (cumulative minus time spent in child nodes) across all ticks, plus self time per call path for
+    flamegraphs. Instrumenting adds a timer around every node, so only enable it when profiling.
+    """
+    def __init__(self):
+        # node -> [calls, successes, total seconds, self seconds]
+        self.node_stats = {}
+        # 'Root;Child;Leaf' call path -> self seconds
+        self.stack_times = {}
+        # Frames of the nodes currently executing: [call path, seconds spent in children]
+        self._frames = []
+
+    def instrument(self, node, run):
+        stats = self.node_stats.setdefault(node, [0, 0, 0.0, 0.0])
+        label = node.label().replace(';', ',')
+        frames, stack_times = self._frames, self.stack_times
+
+        def profiled_run(state):
+            frame = [frames[-1][0] + ';' + label if frames else label, 0.0]
+            frames.append(frame)
+            start = perf_counter()
+            try:
+                result = run(state)
+            finally:
+                elapsed = perf_counter() - start
+                frames.pop()
+                if frames:
+                    frames[-1][1] += elapsed
+                own_time = elapsed - frame[1]
+                stats[0] += 1
+                stats[2] += elapsed
+                stats[3] += own_time
+                stack_times[frame[0]] = stack_times.get(frame[0], 0.0) + own_time
+            if result:
+                stats[1] += 1
+            return result
+        return profiled_run
+
+    def annotated_tree(self, root):
+        """ Returns the tree as text like tree_to_string, with the timings of each node. """
+        lines = []
+        self._annotate(root, 0, lines)
+        return '\n'.join(lines) + '\n'
+
+    def _annotate(self, node, indent, lines):
+        calls, successes, total, own = self.node_stats.get(node, (0, 0, 0.0, 0.0))
+        timing = '  [%d calls, %.3f ms total, %.3f ms self, %.0f%% success]' % \
+                 (calls, total * 1000, own * 1000, 100.0 * successes / calls if calls else 0)
+        lines.append('| ' * indent + node.label() + timing)
+        children = getattr(node, 'child_nodes', None) or \
+                   ([node.child_node] if hasattr(node, 'child_node') else [])
+        for child in children:
+            self._annotate(child, indent + 1, lines)
+
+    def write_collapsed(self, path):
+        """ Writes self time per call path in microseconds, in the collapsed-stack format flamegraph.pl reads. """
+        with open(path, 'w') as f:
+            for stack, seconds in sorted(self.stack_times.items()):
+                f.write('%s %d\n' % (stack, round(seconds * 1e6)))
+
+
 ############################### Base Classes ##################################
 class Node:
     def __init__(self):
@@ -19,6 +151,30 @@ class Node:
     def execute(self, state):
         raise NotImplementedError
 
+    def compile(self, profiler=None):
+        """ Returns a closure equivalent to self.execute. See compile_tree. """
+        run = self._compile(profiler)
+        if profiler is not None:
+            run = profiler.instrument(self, run)
+        if not TRACE:
+            return run
+
+        def logged_run(state):
+            if not logging.getLogger().isEnabledFor(logging.DEBUG):
+                return run(state)
+            logging.debug('Executing: %s', self)
+            result = run(state)
+            logging.debug('Result: %s -> %s', self, 'Success' if result else 'Failure')
+            return result
+        return logged_run
+
+    def _compile(self, profiler):
+        raise NotImplementedError
+
+    def label(self):
+        """ A short one-line description of the node, without its children. """
+        return self.__class__.__name__
+
     def copy(self):
         return deepcopy(self)
 
@@ -34,6 +190,9 @@ class Composite(Node):
     def __str__(self):
         return self.__class__.__name__ + ': ' + self.name if self.name else ''
 
+    def label(self):
+        return self.__class__.__name__ + (': ' + self.name if self.name else '')
+
     def tree_to_string(self, indent=0):
         string = '| ' * indent + str(self) + '\n'
         for child in self.child_nodes:
@@ -59,23 +218,49 @@ class Selector(Composite):
     @log_execution
     def execute(self, state):
         for child_node in self.child_nodes:
+            if out_of_time():
+                return False
             success = child_node.execute(state)
             if success:
                 return True
         else:  # for loop completed without success; return failure
             return False
 
+    def _compile(self, profiler):
+        children = tuple(child_node.compile(profiler) for child_node in self.child_nodes)
+
+        def run(state):
+            for child in children:
+                if perf_counter() >= _deadline:
+                    return False
+                if child(state):
+                    return True
+            return False
+        return run
+
 
 class Sequence(Composite):
     @log_execution
     def execute(self, state):
         for child_node in self.child_nodes:
+            if out_of_time():
+                return False
             continue_execution = child_node.execute(state)
             if not continue_execution:
                 return False
         else:  # for loop completed without failure; return success
             return True
 
+    def _compile(self, profiler):
+        children = tuple(child_node.compile(profiler) for child_node in self.child_nodes)
+
+        def run(state):
+            for child in children:
+                if perf_counter() >= _deadline or not child(state):
+                    return False
+            return True
+        return run
+
 ############################### Decorator Nodes ##################################
 class Inverter(Decorator):
     def __init__(self, child_node):
@@ -86,6 +271,10 @@ class Inverter(Decorator):
         result = self.child_node.execute(state)
         return not result
 
+    def _compile(self, profiler):
+        child = self.child_node.compile(profiler)
+        return lambda state: not child(state)
+
     def __str__(self):
         return self.__class__.__name__ + ': ' + str(self.child_node)
 
@@ -96,10 +285,20 @@ class UntilFailure(Decorator):
 
     @log_execution
     def execute(self, state):
-        while True:
+        while not out_of_time():
             continuing_execution = self.child_node.execute(state)
             if not continuing_execution:
                 return False
+        return False
+
+    def _compile(self, profiler):
+        child = self.child_node.compile(profiler)
+
+        def run(state):
+            while perf_counter() < _deadline and child(state):
+                pass
+            return False
+        return run
 
     def __str__(self):
         return self.__class__.__name__ + ': ' + str(self.child_node)
@@ -114,12 +313,29 @@ class DoNTimes(Decorator):
     @log_execution
     def execute(self, state):
         while self.counter < self.n:
+            if out_of_time():
+                return False
             result = self.child_node.execute(state)
             self.counter += 1
             if not result:
                 return False
         return True
 
+    def _compile(self, profiler):
+        child = self.child_node.compile(profiler)
+        node = self  # The counter stays on the node so reset() keeps working
+
+        def run(state):
+            while node.counter < node.n:
+                if perf_counter() >= _deadline:
+                    return False
+                result = child(state)
+                node.counter += 1
+                if not result:
+                    return False
+            return True
+        return run
+
     def reset(self):
         self.counter = 0
 
@@ -136,6 +352,14 @@ class Succeeder(Decorator):
         self.child_node.execute(state)
         return True
 
+    def _compile(self, profiler):
+        child = self.child_node.compile(profiler)
+
+        def run(state):
+            child(state)
+            return True
+        return run
+
     def __str__(self):
         return self.__class__.__name__ + ': ' + str(self.child_node)
 
@@ -149,6 +373,14 @@ class Failer(Decorator):
         self.child_node.execute(state)
         return False
 
+    def _compile(self, profiler):
+        child = self.child_node.compile(profiler)
+
+        def run(state):
+            child(state)
+            return False
+        return run
+
     def __str__(self):
         return self.__class__.__name__ + ': ' + str(self.child_node)
     
@@ -157,26 +389,39 @@ class Check(Node):
     def __init__(self, check_function, blackboard=None):
         self.check_function = check_function
         self.blackboard = blackboard
+        # Resolved once here instead of probing with a TypeError on every tick
+        self.takes_blackboard = _accepts_blackboard(check_function)
 
     @log_execution
     def execute(self, state):
-        try:
+        if not self.takes_blackboard:
             return self.check_function(state)
-        except TypeError:
+        # Blackboard checks fail rather than crash the turn when the blackboard doesn't hold what they expect
+        try:
+            return self.check_function(state, self.blackboard)
+        except Exception as e:
+            logging.log(logging.ERROR, "check function %s failed: %r", self.check_function.__name__, e)
+            return False
+
+    def _compile(self, profiler):
+        check_function, blackboard = self.check_function, self.blackboard
+        if not self.takes_blackboard:
+            return check_function
+
+        def run(state):
             try:
-                return self.check_function(state, self.blackboard)
+                return check_function(state, blackboard)
             except Exception as e:
-                logging.log(logging.ERROR, "check function has invalid signature: ", e)
+                logging.log(logging.ERROR, "check function %s failed: %r", check_function.__name__, e)
                 return False
-        except Exception as e:
-            logging.log(logging.ERROR, "check function has unknown exception", e)
-            raise e
-            return False
-            
+        return run
 
     def __str__(self):
         return self.__class__.__name__ + ': ' + self.check_function.__name__
 
+    def label(self):
+        return self.__class__.__name__ + ': ' + _callback_name(self.check_function)
+
 
 class PushToStack(Node):
     def __init__(self, blackboard : dict, stack_name, item_key):
@@ -185,6 +430,9 @@ class PushToStack(Node):
         self.stack_key = stack_name
         self.item_key = item_key
 
+    def label(self):
+        return '%s: %s -> %s' % (self.__class__.__name__, self.item_key, self.stack_key)
+
     @log_execution
     def execute(self, state):
         item = self.blackboard.get(self.item_key, None)
@@ -193,10 +441,25 @@ class PushToStack(Node):
             return False
         if not self.stack_key in self.blackboard:
             self.blackboard[self.stack_key] = []
-        logging.info(f"Pushed item to stack {self.stack_key}: {item}")
+        if TRACE:
+            logging.debug("Pushed item to stack %s: %s", self.stack_key, item)
         self.blackboard[self.stack_key].append(item)
         return True
 
+    def _compile(self, profiler):
+        blackboard, stack_key, item_key = self.blackboard, self.stack_key, self.item_key
+
+        def run(state):
+            item = blackboard.get(item_key, None)
+            assert item is not None, "Item with key item_key in blackboard is not found"
+            if not item:
+                return False
+            if TRACE:
+                logging.debug("Pushed item to stack %s: %s", stack_key, item)
+            blackboard.setdefault(stack_key, []).append(item)
+            return True
+        return run
+
 
 class PopFromStack(Node):
     def __init__(self, blackboard : dict, stack_name, item_key):
@@ -205,28 +468,67 @@ class PopFromStack(Node):
         self.stack_key = stack_name
         self.item_key = item_key
     
+    def label(self):
+        return '%s: %s -> %s' % (self.__class__.__name__, self.stack_key, self.item_key)
+
     @log_execution
     def execute(self, state):
         stack = self.blackboard.get(self.stack_key, None)
         assert isinstance(stack, list), f"Item with key stack_key in blackboard is not a list: {stack}"
         if not isinstance(stack, list) or len(stack) == 0:
             return False
-        logging.info(f"Popped from stack {self.stack_key} value: {stack[-1]}")
+        if TRACE:
+            logging.debug("Popped from stack %s value: %s", self.stack_key, stack[-1])
         self.blackboard[self.item_key] = stack.pop()
         return True
 
+    def _compile(self, profiler):
+        blackboard, stack_key, item_key = self.blackboard, self.stack_key, self.item_key
+
+        def run(state):
+            stack = blackboard.get(stack_key, None)
+            assert isinstance(stack, list), f"Item with key stack_key in blackboard is not a list: {stack}"
+            if not stack:
+                return False
+            if TRACE:
+                logging.debug("Popped from stack %s value: %s", stack_key, stack[-1])
+            blackboard[item_key] = stack.pop()
+            return True
+        return run
+
 
 class SetVar(Node):
     def __init__(self, blackboard : dict, var_key, value_function: callable):
         self.var_key = var_key
         self.value_function = value_function
         self.blackboard = blackboard
+        self.takes_blackboard = _accepts_blackboard(value_function)
+
+    def label(self):
+        return '%s: %s = %s' % (self.__class__.__name__, self.var_key, _callback_name(self.value_function))
 
     @log_execution
     def execute(self, state):
-        self.blackboard[self.var_key] = self.value_function(state)
-        logging.info(f"Setting Variable {self.var_key} with value: {self.blackboard[self.var_key]}")
+        if self.takes_blackboard:
+            self.blackboard[self.var_key] = self.value_function(state, self.blackboard)
+        else:
+            self.blackboard[self.var_key] = self.value_function(state)
+        if TRACE:
+            logging.debug("Setting Variable %s with value: %s", self.var_key, self.blackboard[self.var_key])
         return True
+
+    def _compile(self, profiler):
+        blackboard, var_key, value_function = self.blackboard, self.var_key, self.value_function
+        if self.takes_blackboard:
+            function = value_function
+            value_function = lambda state: function(state, blackboard)
+
+        def run(state):
+            blackboard[var_key] = value = value_function(state)
+            if TRACE:
+                logging.debug("Setting Variable %s with value: %s", var_key, value)
+            return True
+        return run
     
 
 class IsVarNull(Node):
@@ -234,18 +536,38 @@ class IsVarNull(Node):
         self.var_key = var_key
         self.blackboard = blackboard
 
+    def label(self):
+        return self.__class__.__name__ + ': ' + self.var_key
+
     @log_execution
     def execute(self, state) -> bool:
         return self.blackboard.get(self.var_key, None) is None
 
+    def _compile(self, profiler):
+        blackboard, var_key = self.blackboard, self.var_key
+        return lambda state: blackboard.get(var_key, None) is None
+
 
 class Action(Node):
-    def __init__(self, action_function):
+    def __init__(self, action_function, blackboard=None):
         self.action_function = action_function
+        self.blackboard = blackboard
+        self.takes_blackboard = _accepts_blackboard(action_function)
 
     @log_execution
     def execute(self, state):
+        if self.takes_blackboard:
+            return self.action_function(state, self.blackboard)
         return self.action_function(state)
 
+    def _compile(self, profiler):
+        action_function, blackboard = self.action_function, self.blackboard
+        if self.takes_blackboard:
+            return lambda state: action_function(state, blackboard)
+        return action_function
+
     def __str__(self):
         return self.__class__.__name__ + ': ' + self.action_function.__name__
+
+    def label(self):
+        return self.__class__.__name__ + ': ' + _callback_name(self.action_function)
@@ -1,22 +1,21 @@
 from functools import reduce
 import logging
-from statistics import median
 
-from planet_wars import PlanetWars, Planet, get_blackboard
+from planet_wars import PlanetWars, Planet, Blackboard, get_blackboard
 from behaviors import *
 
 def if_neutral_planet_available(state):
     return any(state.neutral_planets())
 
 def have_largest_fleet(state):
-    return sum(planet.num_ships for planet in state.my_planets()) \
-             + sum(fleet.num_ships for fleet in state.my_fleets()) \
-           > sum(planet.num_ships for planet in state.enemy_planets()) \
-             + sum(fleet.num_ships for fleet in state.enemy_fleets())
+    return get_total_ships(state, 1) > get_total_ships(state, 2)
 
 def multiple_planets_available(state):
     return len(state.my_planets()) >= 2
 
+def no_orders_issued(state):
+    return not state.issued_orders
+
 def enemy_planets_available(state):
     return len(state.enemy_planets()) > 0
 
@@ -43,7 +42,7 @@ def planet_in_danger(state): #Do we need to send defenders to any planets?
     logging.info("CHECK: No planets in danger")
     return False
 
-def steal_stack_not_empty(state:PlanetWars, blackboard: dict) -> bool:
+def steal_stack_not_empty(state:PlanetWars, blackboard: Blackboard) -> bool:
     logging.info("CHECK: Checking steal stack")
     if "attacked_neutral_planet_stack" not in blackboard:
         logging.info("CHECK: Steal stack key not found in blackboard")
@@ -54,15 +53,15 @@ def steal_stack_not_empty(state:PlanetWars, blackboard: dict) -> bool:
     logging.info("CHECK: Success, steal stack contains planets")
     return True
 
-def is_planet_stealable(state:PlanetWars, blackboard: dict) -> bool:
-    assert blackboard.get("attacked_neutral_planet", None) is not None, "Planet to steal is none in check function"
+def is_planet_stealable(state:PlanetWars, blackboard: Blackboard) -> bool:
+    assert blackboard.attacked_neutral_planet is not None, "Planet to steal is none in check function"
     # Tweakable Params
     # Higer = Willing to consider stealing longer after initial enemy arrival
     arrival_turn_grace_period = 3
     # Higher = More aggresive and risky stealing. Multiply free ships by phaser_strength to get available stealing force.
     phaser_strength = 0.7
 
-    planet : Planet = blackboard.get("attacked_neutral_planet")
+    planet : Planet = blackboard.attacked_neutral_planet
     attacking_fleets = [fleet for fleet in get_attacking_fleets(state, planet.ID) if fleet.owner == 2]
     attacking_fleets.sort(key=lambda fleet: fleet.turns_remaining, reverse=True)
     total_attacking_force = reduce(lambda a, b: a + b.num_ships, attacking_fleets, 0)
@@ -89,6 +88,7 @@ def is_planet_stealable(state:PlanetWars, blackboard: dict) -> bool:
         return False
 
     # Wait for enemy to take first
+    from statistics import median  # Only needed here, and slow to import at start-up
     nearby_allies_distance = [state.distance(p.ID, planet.ID) for p in nearby_allies[:3]]
     if median(nearby_allies_distance) < capture_time:
         return False
@@ -100,7 +100,7 @@ def is_planet_stealable(state:PlanetWars, blackboard: dict) -> bool:
     return True
 
 
-def is_planet_weaker_than_our_strength(state: PlanetWars, blackboard: dict) -> bool:
+def is_planet_weaker_than_our_strength(state: PlanetWars, blackboard: Blackboard) -> bool:
     # Param
     # Only attack if the planet is weaker than 60% of our total strength
     # Constants for the minimum and maximum percentage values
@@ -113,7 +113,7 @@ def is_planet_weaker_than_our_strength(state: PlanetWars, blackboard: dict) -> b
     strength_factor = 1 / (1 + total_strength * 0.1)
     base_percentage = friendly_planet_factor + enemy_planet_factor + strength_factor
     total_strength_percentage = max(min_percentage, min(max_percentage, base_percentage))
-    target = blackboard.get("capture_target", None)
+    target = blackboard.capture_target
     if target is None:
         logging.error("Capture Target is none in is_planet_weaker_than_our_strength check")
         return False
@@ -126,7 +126,7 @@ def is_planet_weaker_than_our_strength(state: PlanetWars, blackboard: dict) -> b
 
 def will_planet_be_captured_by_us(state: PlanetWars):
     blackboard = get_blackboard()
-    target = blackboard.get("capture_target", None)
+    target = blackboard.capture_target
     if target is None:
         logging.error("Capture Target is none in is_planet_weaker_than_our_strength check")
         return False
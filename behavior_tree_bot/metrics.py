@@ -0,0 +1,49 @@
+"""
+Low-overhead sink for structured debug output from the behavior helpers.
+
+emit() and count() only touch memory: events go into a bounded ring buffer and counters into a dict. flush() writes
+everything recorded for the turn as JSON lines in a single write, and is called once per turn by the bot main loop.
+Until configure() is given a path, emit() and count() return immediately.
+"""
+from collections import deque
+
+_path = None
+_events = deque(maxlen=4096)
+_counters = {}
+turn = 0
+
+
+def configure(path, capacity=4096):
+    """ Start recording, appending each turn's records to path. Pass None to stop recording. """
+    global _path, _events
+    _path = path
+    _events = deque(maxlen=capacity)
+    _counters.clear()
+    if path is not None:
+        open(path, 'w').close()
+
+
+def emit(event, **fields):
+    """ Record one event with arbitrary JSON-serializable fields. Oldest events are dropped past capacity. """
+    if _path is not None:
+        _events.append((event, fields))
+
+
+def count(counter, amount=1):
+    if _path is not None:
+        _counters[counter] = _counters.get(counter, 0) + amount
+
+
+def flush():
+    """ Write the turn's events and counters to the configured file and start the next turn. """
+    global turn
+    if _path is not None and (_events or _counters):
+        import json  # Only needed once recording is configured
+        lines = [json.dumps(dict(fields, turn=turn, event=event)) for event, fields in _events]
+        if _counters:
+            lines.append(json.dumps({'turn': turn, 'counters': _counters}))
+        with open(_path, 'a') as f:
+            f.write('\n'.join(lines) + '\n')
+        _events.clear()
+        _counters.clear()
+    turn += 1
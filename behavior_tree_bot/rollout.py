@@ -0,0 +1,165 @@
+"""
+Forward rollouts of the Planet Wars rules for the lookahead behavior.
+
+A Rollout holds one turn's state as flat lists: owners, ships and an arrivals table indexed by
+(turn * num_planets + planet) * 3 + player, so copying the state for a rollout is three list slices. Both players are
+played by a simple model (every few turns the strongest planet sends half its ships to one of the nearest planets it
+does not own, chosen at random), and a rollout is scored by ships plus weighted production at the horizon.
+
+search() spends a time slice running rollouts of each candidate order set, picking which candidate to roll out next
+with UCB1, and returns the candidate with the best mean score.
+"""
+from math import log, sqrt
+from random import Random
+from time import perf_counter
+
+# Turns simulated per rollout; fleets landing later only count as ships in flight
+HORIZON = 30
+# The model players move every MODEL_PERIOD turns
+MODEL_PERIOD = 3
+# How many of a planet's nearest targets the model picks between
+MODEL_CHOICES = 3
+# Ships a planet needs before the model sends half of them
+MODEL_MIN_SHIPS = 10
+# Score value of one ship of production per turn
+GROWTH_WEIGHT = 10
+EXPLORATION = 1.0
+
+
+class Rollout:
+    def __init__(self, state):
+        planets = state.planets
+        n = self.num_planets = len(planets)
+        self.growth = [p.growth_rate for p in planets]
+        self.owners = [p.owner for p in planets]
+        self.ships = [p.num_ships for p in planets]
+        self.distances = [state.distance(i, j) for i in range(n) for j in range(n)]
+        self.neighbours = [state.neighbours(i) for i in range(n)]
+        self.arrivals = [0] * ((HORIZON + 1) * n * 3)
+        # Ships per player in fleets landing past the horizon
+        self.late = [0, 0, 0]
+        for fleet in state.fleets:
+            self._send(self.arrivals, self.late, fleet.owner, fleet.num_ships, fleet.destination_planet,
+                       fleet.turns_remaining)
+
+    def _send(self, arrivals, late, owner, num_ships, destination, arrival):
+        if arrival > HORIZON:
+            late[owner] += num_ships
+        else:
+            arrivals[(arrival * self.num_planets + destination) * 3 + owner] += num_ships
+
+    def _model_move(self, player, turn, owners, ships, arrivals, late, rng):
+        source, most = -1, MODEL_MIN_SHIPS - 1
+        for planet_id in range(self.num_planets):
+            if owners[planet_id] == player and ships[planet_id] > most:
+                source, most = planet_id, ships[planet_id]
+        if source < 0:
+            return
+        targets = []
+        for neighbour_id in self.neighbours[source]:
+            if owners[neighbour_id] != player:
+                targets.append(neighbour_id)
+                if len(targets) == MODEL_CHOICES:
+                    break
+        if not targets:
+            return
+        destination = targets[rng.randrange(len(targets))]
+        num_ships = ships[source] // 2
+        ships[source] -= num_ships
+        self._send(arrivals, late, player, num_ships, destination,
+                   turn + self.distances[source * self.num_planets + destination])
+
+    def play(self, orders, rng):
+        """ Plays our orders, then both model players up to the horizon. Returns our score minus the enemy's. """
+        n = self.num_planets
+        growth = self.growth
+        owners = self.owners[:]
+        ships = self.ships[:]
+        arrivals = self.arrivals[:]
+        late = self.late[:]
+        for source, destination, num_ships in orders:
+            ships[source] -= num_ships
+            self._send(arrivals, late, 1, num_ships, destination, self.distances[source * n + destination])
+
+        for turn in range(1, HORIZON + 1):
+            if turn % MODEL_PERIOD == 0:
+                self._model_move(1, turn - 1, owners, ships, arrivals, late, rng)
+                self._model_move(2, turn - 1, owners, ships, arrivals, late, rng)
+            base = turn * n * 3
+            for planet_id in range(n):
+                owner = owners[planet_id]
+                if owner:
+                    ships[planet_id] += growth[planet_id]
+                index = base + planet_id * 3
+                ours, theirs = arrivals[index + 1], arrivals[index + 2]
+                if not (ours or theirs):
+                    continue
+                # Same rules as planet_wars.resolve_battle, unrolled for two players and the neutral
+                forces = [0, ours, theirs]
+                forces[owner] += ships[planet_id]
+                first = max(forces)
+                leaders = [player for player in (0, 1, 2) if forces[player] == first]
+                if len(leaders) > 1:
+                    ships[planet_id] = 0
+                else:
+                    winner = leaders[0]
+                    forces[winner] = 0
+                    owners[planet_id] = winner
+                    ships[planet_id] = first - max(forces)
+
+        score = late[1] - late[2]
+        for planet_id in range(n):
+            owner = owners[planet_id]
+            if owner == 1:
+                score += ships[planet_id] + growth[planet_id] * GROWTH_WEIGHT
+            elif owner == 2:
+                score -= ships[planet_id] + growth[planet_id] * GROWTH_WEIGHT
+        return score
+
+
+def search(state, candidates, time_slice, max_rollouts=None, seed=None):
+    """
+    Rolls out the candidate order sets for up to time_slice seconds (or max_rollouts rollouts) and returns the index
+    of the candidate with the best mean score, and how many rollouts were played. With time_slice None exactly
+    max_rollouts rollouts are played, so the result depends only on the state and the seed.
+
+    Parameters:
+        state (PlanetWars): The current game state, before any of the candidates are issued
+        candidates (List[List[(int, int, int)]]): Order sets as (source, destination, num_ships) lists
+        time_slice (float): Seconds to search for, or None to play exactly max_rollouts rollouts
+        max_rollouts (int, optional): Stop after this many rollouts (default: no limit)
+        seed (int, optional): Seed for the model players (default: derived from the state)
+
+    Returns:
+        (int, int): The index of the best candidate and the number of rollouts played
+    """
+    if time_slice is None:
+        if max_rollouts is None:
+            raise ValueError("search needs a time slice or a rollout count")
+        deadline = float('inf')
+    else:
+        deadline = perf_counter() + time_slice
+    rollout = Rollout(state)
+    rng = Random(sum(rollout.ships) if seed is None else seed)
+    totals = [0.0] * len(candidates)
+    counts = [0] * len(candidates)
+
+    played = 0
+    while played < len(candidates) or perf_counter() < deadline:
+        if max_rollouts is not None and played >= max_rollouts:
+            break
+        if played < len(candidates):
+            # Every candidate is rolled out once before UCB1 takes over
+            choice = played
+        else:
+            # Scores are normalized by the largest mean seen so the exploration term stays in scale
+            scale = max(abs(total / count) for total, count in zip(totals, counts)) or 1
+            log_played = log(played)
+            choice = max(range(len(candidates)), key=lambda i: totals[i] / counts[i] / scale +
+                         EXPLORATION * sqrt(log_played / counts[i]))
+        totals[choice] += rollout.play(candidates[choice], rng)
+        counts[choice] += 1
+        played += 1
+
+    best = max((i for i in range(len(candidates)) if counts[i]), key=lambda i: totals[i] / counts[i])
+    return best, played
@@ -0,0 +1,247 @@
+#!/usr/bin/env python
+#
+"""
+    Benchmarks the behavior tree bot's per-turn decision latency.
+
+    Every map in maps/ contributes its starting state plus mid-game snapshots taken from in-process games against the
+    opponent bots (including the turn with the most fleets in flight). Each snapshot is replayed through bt_bot's
+    do_turn and the p50/p95/p99/max latency and the peak traced memory are compared against benchmark_baseline.json.
+    The run fails if any figure regresses past the tolerance or a single turn gets near PlayGame's 1000 ms limit.
+
+    The lookahead would otherwise fill its time slice and swamp the tree's own cost, so the snapshot games play it
+    with a fixed rollout count (making the snapshots the same on every run), do_turn is timed with its slice set to
+    zero (candidate plans are still built), and the lookahead is timed on its own: lookahead_ms is the median time of
+    LOOKAHEAD_ROLLOUTS rollouts over the snapshots.
+
+    It also times bot start-up: process start to the first "go" on a map's opening state (import, tree
+    construction and the first turn), the median of several runs, which must stay under STARTUP_TARGET_MS.
+
+    usage: python benchmark.py [--update-baseline] [--tolerance 0.25] [--repeats 3] [--maps N] [--startup]
+"""
+import argparse
+import glob
+import json
+import os
+import subprocess
+import sys
+import tracemalloc
+from math import ceil
+from time import perf_counter
+
+import simulator
+from planet_wars import PlanetWars, get_blackboard
+
+BOT = 'behavior_tree_bot/bt_bot.py'
+SNAPSHOT_OPPONENTS = ['opponent_bots/aggressive_bot.py', 'opponent_bots/defensive_bot.py',
+                      'opponent_bots/easy_bot.py', 'opponent_bots/production_bot.py',
+                      'opponent_bots/spread_bot.py']
+SNAPSHOT_TURNS = (30, 100, 200)
+SNAPSHOT_MAX_TURNS = 250
+# Rollouts per lookahead while collecting snapshots and when timing the lookahead
+LOOKAHEAD_ROLLOUTS = 200
+BASELINE_FILE = 'benchmark_baseline.json'
+
+# A turn this slow is a near-certain timeout under PlayGame, whatever the baseline says
+TURN_LIMIT_MS = 900
+# Differences below this are timer noise on sub-millisecond turns
+LATENCY_SLACK_MS = 0.5
+# Process start to first "go", paid by every bot in every PlayGame match
+STARTUP_TARGET_MS = 250
+STARTUP_RUNS = 7
+
+
+def map_number(map_path):
+    return int(os.path.basename(map_path)[3:-4])
+
+
+def collect_snapshots(map_paths):
+    """ Returns (label, planets, fleets) for the start of every map and a few points in a game on it. """
+    bot = simulator.load_bot(BOT)
+    bot.LOOKAHEAD_ROLLOUTS = LOOKAHEAD_ROLLOUTS
+    snapshots = []
+    for index, map_path in enumerate(map_paths):
+        map_name = os.path.basename(map_path)[:-4]
+        game = simulator.Game.from_map(map_path)
+        snapshots.append((map_name + ':start', game.planets, game.fleets))
+
+        busiest = [None]
+
+        def observe(game):
+            if game.turn in SNAPSHOT_TURNS:
+                snapshots.append(('%s:turn%d' % (map_name, game.turn), list(game.planets), list(game.fleets)))
+            if busiest[0] is None or len(game.fleets) > len(busiest[0][2]):
+                busiest[0] = ('%s:busiest' % map_name, list(game.planets), list(game.fleets))
+
+        opponent = SNAPSHOT_OPPONENTS[index % len(SNAPSHOT_OPPONENTS)]
+        simulator.play_match(BOT, opponent, map_path, SNAPSHOT_MAX_TURNS, turn_time=None, observer=observe)
+        if busiest[0] is not None and busiest[0][2]:
+            snapshots.append(busiest[0])
+    return snapshots
+
+
+def run_turn(bot, planets, fleets):
+    state = PlanetWars.from_objects(planets, fleets, output=None)
+    get_blackboard().reset_game()
+    start = perf_counter()
+    bot.do_turn(state)
+    return (perf_counter() - start) * 1000
+
+
+def percentile(sorted_samples, fraction):
+    """ Nearest-rank percentile of an already sorted list. """
+    rank = max(ceil(fraction * len(sorted_samples)) - 1, 0)
+    return sorted_samples[min(rank, len(sorted_samples) - 1)]
+
+
+def measure_lookahead(bot, snapshots):
+    """ Median milliseconds for LOOKAHEAD_ROLLOUTS rollouts, over the snapshots that have candidate plans. """
+    # The bot's directory is on sys.path once it has been loaded
+    import rollout
+    samples = []
+    for label, planets, fleets in snapshots:
+        state = PlanetWars.from_objects(planets, fleets, output=None)
+        get_blackboard().reset_game()
+        candidates = bot.get_lookahead_candidates(state)
+        if len(candidates) == 1:
+            continue
+        start = perf_counter()
+        rollout.search(state, candidates, None, LOOKAHEAD_ROLLOUTS)
+        samples.append((perf_counter() - start) * 1000)
+    samples.sort()
+    return percentile(samples, 0.50) if samples else 0.0
+
+
+def measure(snapshots, repeats):
+    bot = simulator.load_bot(BOT)
+    # Time the tree without the lookahead's slice, which is measured by measure_lookahead instead
+    bot.LOOKAHEAD_ROLLOUTS = None
+    bot.LOOKAHEAD_SLICE = 0
+    samples = []
+    slowest = (0.0, None)
+    for label, planets, fleets in snapshots:
+        for _ in range(repeats):
+            elapsed = run_turn(bot, planets, fleets)
+            samples.append(elapsed)
+            if elapsed > slowest[0]:
+                slowest = (elapsed, label)
+
+    # Memory is traced in its own pass since tracemalloc slows every allocation down
+    peak = 0
+    tracemalloc.start()
+    for label, planets, fleets in snapshots:
+        tracemalloc.reset_peak()
+        run_turn(bot, planets, fleets)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+    tracemalloc.stop()
+
+    samples.sort()
+    results = {
+        'p50_ms': percentile(samples, 0.50),
+        'p95_ms': percentile(samples, 0.95),
+        'p99_ms': percentile(samples, 0.99),
+        'max_ms': samples[-1],
+        'peak_kib': peak / 1024,
+        'lookahead_ms': measure_lookahead(bot, snapshots),
+    }
+    return results, slowest[1]
+
+
+def measure_startup(bot=BOT, map_path='maps/map1.txt', runs=STARTUP_RUNS):
+    """
+    Median milliseconds from launching the bot to reading its first "go", like PlayGame's first turn. Raises
+    RuntimeError if the bot exits without sending one.
+    """
+    with open(map_path) as map_file:
+        first_turn = (map_file.read().rstrip('\n') + '\ngo\n').encode()
+    samples = []
+    for _ in range(runs):
+        start = perf_counter()
+        process = subprocess.Popen([sys.executable, bot], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                   stderr=subprocess.DEVNULL)
+        try:
+            process.stdin.write(first_turn)
+            process.stdin.flush()
+            for line in process.stdout:
+                if line.strip() == b'go':
+                    break
+            else:
+                raise RuntimeError('%s exited with status %s before its first "go"' % (bot, process.wait()))
+            samples.append((perf_counter() - start) * 1000)
+        finally:
+            process.stdin.close()
+            process.kill()
+            process.wait()
+    samples.sort()
+    return samples[len(samples) // 2]
+
+
+def compare(results, baseline, tolerance):
+    """ Returns a list of failure messages, empty if the run is within tolerance of the baseline. """
+    failures = []
+    if results.get('max_ms', 0) > TURN_LIMIT_MS:
+        failures.append('slowest turn took %.1f ms, over the %d ms limit' % (results['max_ms'], TURN_LIMIT_MS))
+    if results.get('startup_ms', 0) > STARTUP_TARGET_MS:
+        failures.append('start-up took %.1f ms, over the %d ms target' % (results['startup_ms'], STARTUP_TARGET_MS))
+    for key, value in results.items():
+        if key not in baseline:
+            continue
+        slack = LATENCY_SLACK_MS if key.endswith('_ms') else 0
+        allowed = baseline[key] * (1 + tolerance) + slack
+        if value > allowed:
+            failures.append('%s regressed: %.2f against a baseline of %.2f (allowed %.2f)'
+                            % (key, value, baseline[key], allowed))
+    return failures
+
+
+if __name__ == '__main__':
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    parser = argparse.ArgumentParser(description='Benchmark bt_bot per-turn latency and memory.')
+    parser.add_argument('--update-baseline', action='store_true', help='store this run as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed fractional slowdown (default 0.25)')
+    parser.add_argument('--repeats', type=int, default=3, help='timed runs per snapshot (default 3)')
+    parser.add_argument('--maps', type=int, default=None, help='only use the first N maps')
+    parser.add_argument('--startup', action='store_true', help='only measure start-up')
+    args = parser.parse_args()
+
+    results = {}
+    if not args.startup:
+        map_paths = sorted(glob.glob('maps/map*.txt'), key=map_number)[:args.maps]
+        snapshots = collect_snapshots(map_paths)
+        results, slowest_snapshot = measure(snapshots, args.repeats)
+        print('%d snapshots from %d maps, %d runs each' % (len(snapshots), len(map_paths), args.repeats))
+    try:
+        results['startup_ms'] = measure_startup()
+    except RuntimeError as error:
+        print('FAIL:', error)
+        sys.exit(1)
+
+    for key, value in results.items():
+        print('  %-10s %10.2f' % (key, value))
+    if not args.startup:
+        print('  slowest snapshot: %s' % slowest_snapshot)
+
+    if args.update_baseline:
+        stored = {}
+        if args.startup and os.path.exists(BASELINE_FILE):
+            with open(BASELINE_FILE) as f:
+                stored = json.load(f)
+        stored.update({key: round(value, 3) for key, value in results.items()})
+        with open(BASELINE_FILE, 'w') as f:
+            json.dump(stored, f, indent=2)
+            f.write('\n')
+        print('Baseline written to', BASELINE_FILE)
+        sys.exit(0)
+
+    baseline = {}
+    if os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE) as f:
+            baseline = json.load(f)
+    else:
+        print('No baseline found, run with --update-baseline to store one.')
+
+    failures = compare(results, baseline, args.tolerance)
+    for failure in failures:
+        print('FAIL:', failure)
+    if failures:
+        sys.exit(1)
+    print('OK')
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+#
+"""
+    Stand-in bot for PlayGame that forwards the game to a warm bot_server.py worker. It only imports what it needs to
+    relay bytes, so starting it costs little more than starting the interpreter.
+
+    usage: python bot_client.py <bot name> [port]
+"""
+import os
+import socket
+import sys
+import threading
+
+DEFAULT_PORT = 8765
+# Same as bot_server.ERROR_PREFIX, not imported so the client stays cheap to start
+ERROR_PREFIX = b'error: '
+
+
+def relay_input(connection):
+    # Engine -> server, until the engine closes our stdin
+    stdin = sys.stdin.buffer
+    try:
+        while True:
+            chunk = stdin.read1(1 << 16)
+            if not chunk:
+                break
+            connection.sendall(chunk)
+        connection.shutdown(socket.SHUT_WR)
+    except OSError:
+        # The server already closed the game
+        pass
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print('usage: python bot_client.py <bot name> [port]')
+        sys.exit(1)
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_PORT
+    connection = socket.create_connection(('127.0.0.1', port))
+    connection.sendall(sys.argv[1].encode() + b'\n')
+    threading.Thread(target=relay_input, args=(connection,), daemon=True).start()
+
+    # Server -> engine, until the server ends the game
+    stdout = sys.stdout.buffer
+    status = 0
+    first = True
+    while True:
+        try:
+            chunk = connection.recv(1 << 16)
+        except ConnectionResetError:
+            # The server dropped the game
+            status = 1
+            break
+        if not chunk:
+            break
+        if first and chunk.startswith(ERROR_PREFIX):
+            # The server refused the game, e.g. for an unknown bot name
+            sys.stderr.write(chunk.decode(errors='replace'))
+            status = 1
+            break
+        first = False
+        stdout.write(chunk)
+        stdout.flush()
+    # Skip interpreter shutdown, the input thread may still be blocked reading stdin
+    os._exit(status)
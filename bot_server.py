@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+#
+"""
+    Long-lived bot server, so PlayGame matches do not pay interpreter start-up and tree construction per game.
+
+    The server starts a pool of workers sharing one listening socket. Each worker imports behavior_tree_bot/bt_bot.py
+    and every opponent_bots/*.py once and builds the behavior tree, so it works with any multiprocessing start method.
+    Each connection is one game for one bot: the client sends the bot's name on the first line and then relays the
+    engine's input and the bot's orders (see bot_client.py). A worker resets the per-game state before every game, so
+    it can serve any number of consecutive matches.
+
+    usage: python bot_server.py [--port 8765] [--workers N]
+    then give PlayGame "python bot_client.py bt_bot" (or aggressive_bot, ...) instead of "python bt_bot.py".
+"""
+import glob
+import logging
+import os
+import socket
+import sys
+from multiprocessing import Process
+
+import simulator
+from planet_wars import GameStateReader, finish_turn, get_blackboard
+
+DEFAULT_PORT = 8765
+# Starts the line the server sends instead of a game, see bot_client.py
+ERROR_PREFIX = 'error: '
+BOT_PATHS = ['behavior_tree_bot/bt_bot.py'] + sorted(glob.glob('opponent_bots/*.py'))
+
+
+def bot_name(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def load_bots():
+    """ Imports every bot once and builds bt_bot's tree up front. Returns bot name -> module. """
+    bots = {}
+    for path in BOT_PATHS:
+        bots[bot_name(path)] = simulator.load_bot(path)
+    bt_bot = bots.get('bt_bot')
+    if bt_bot is not None and bt_bot.behavior_tree is None:
+        bt_bot.behavior_tree = bt_bot.compile_tree(bt_bot.setup_behavior_tree())
+    return bots
+
+
+def reset_game():
+    """ Clears everything a bot may carry over from its previous game. """
+    get_blackboard().reset_game()
+
+
+def play_game(bots, connection):
+    """
+    Plays one game on a client connection. Like a standalone bt_bot, a turn that raises is logged and still ends with
+    "go", so the bot keeps playing with whatever orders it issued before the error.
+    """
+    reader = connection.makefile('rb')
+    writer = connection.makefile('w')
+    try:
+        name = reader.readline().decode().strip()
+        module = bots.get(name)
+        if module is None:
+            logging.error("Unknown bot %r", name)
+            # Bots only ever write orders and "go", so the client can tell this line apart and exit with an error
+            writer.write('%sunknown bot %r\n' % (ERROR_PREFIX, name))
+            return
+        reset_game()
+        for planet_wars in GameStateReader(reader, output=writer):
+            try:
+                module.do_turn(planet_wars)
+            except Exception:
+                logging.exception("Error in turn.")
+            finish_turn(planet_wars)
+    except (BrokenPipeError, ConnectionResetError):
+        pass
+    finally:
+        reader.close()
+        try:
+            writer.close()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        connection.close()
+
+
+def worker(listener):
+    # Workers share log files, so bots log nothing from here
+    logging.disable(logging.CRITICAL)
+    # Loaded here rather than passed from the server, since modules cannot be sent to a spawned process
+    bots = load_bots()
+    while True:
+        connection, _ = listener.accept()
+        play_game(bots, connection)
+
+
+def serve(port=DEFAULT_PORT, workers=None):
+    listener = socket.create_server(('127.0.0.1', port))
+    listener.listen(64)
+    workers = [Process(target=worker, args=(listener,), daemon=True) for _ in range(workers or os.cpu_count())]
+    for process in workers:
+        process.start()
+    names = sorted(bot_name(path) for path in BOT_PATHS)
+    print('Serving %s on port %d with %d workers' % (', '.join(names), port, len(workers)))
+    try:
+        for process in workers:
+            process.join()
+    except KeyboardInterrupt:
+        print('ctrl-c, leaving ...')
+    finally:
+        for process in workers:
+            process.terminate()
+        listener.close()
+
+
+if __name__ == '__main__':
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    args = sys.argv[1:]
+    options = {'--port': DEFAULT_PORT, '--workers': None}
+    for option in options:
+        if option in args:
+            index = args.index(option)
+            options[option] = int(args[index + 1])
+            del args[index:index + 2]
+    serve(options['--port'], options['--workers'])
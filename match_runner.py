@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+#
+"""
+    Runs PlayGame.jar matches as child processes with asyncio, keeping a fixed number in flight.
+
+    Each match is started from an argument list (no shell). Its playback (stdout) is streamed to a file for
+    playback.py, and its status output (stderr) is scanned for the result. A match that runs past its timeout is
+    killed, and every child is waited for before its slot is reused, so no Java processes are left behind.
+"""
+import asyncio
+import os
+import re
+import subprocess
+import sys
+from collections import namedtuple
+from time import perf_counter
+
+PLAYGAME = ['java', '-jar', 'tools/PlayGame.jar']
+SHOWGAME = ['java', '-jar', 'tools/ShowGame.jar']
+
+Match = namedtuple('Match', ['bot', 'opponent_bot', 'map_num', 'playback_file', 'log_file'])
+# winner is None when PlayGame never reported a result, e.g. when the match was killed for running too long
+MatchOutcome = namedtuple('MatchOutcome', ['match', 'winner', 'timed_out', 'crashed', 'killed', 'returncode',
+                                           'elapsed'])
+
+# PlayGame's Engine reports drops as "WARNING: player N timed out." / "WARNING: player N crashed."
+_RESULT_LINES = [
+    (re.compile(rb'Player (\d) Wins!'), 'winner'),
+    (re.compile(rb'^Draw!'), 'draw'),
+    (re.compile(rb'player (\d) timed out'), 'timed_out'),
+    (re.compile(rb'player (\d) crashed'), 'crashed'),
+]
+
+
+def make_match(bot, opponent_bot, map_num, output_dir='matches'):
+    """ Builds a Match whose playback and engine log go to their own files under output_dir. """
+    name = '%s_vs_%s_map%d' % (_bot_name(bot), _bot_name(opponent_bot), map_num)
+    return Match(bot, opponent_bot, map_num, os.path.join(output_dir, name + '.playback'),
+                 os.path.join(output_dir, name + '.log'))
+
+
+def _make_dirs(match):
+    for path in (match.playback_file, match.log_file):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+
+def _bot_name(bot):
+    return os.path.splitext(os.path.basename(bot))[0]
+
+
+def playgame_command(match, max_turns=1000, turn_time=1000):
+    """ The PlayGame argument list for a match. Each bot command is one argument, which PlayGame splits itself. """
+    return PLAYGAME + ['maps/map%d.txt' % match.map_num, str(turn_time), str(max_turns), match.log_file,
+                       'python ' + match.bot, 'python ' + match.opponent_bot]
+
+
+async def _copy_stream(reader, path):
+    with open(path, 'wb') as f:
+        while True:
+            chunk = await reader.read(1 << 16)
+            if not chunk:
+                return
+            f.write(chunk)
+
+
+async def _read_result(reader):
+    result = {}
+    async for line in reader:
+        line = line.strip()
+        for pattern, key in _RESULT_LINES:
+            found = pattern.search(line)
+            if found:
+                result[key] = int(found.group(1)) if found.groups() else 0
+    return result
+
+
+async def run_match(match, timeout=None, max_turns=1000, turn_time=1000):
+    """ Plays one match under PlayGame and returns its MatchOutcome. timeout is in seconds for the whole match. """
+    _make_dirs(match)
+    start = perf_counter()
+    process = await asyncio.create_subprocess_exec(*playgame_command(match, max_turns, turn_time),
+                                                   stdin=asyncio.subprocess.DEVNULL,
+                                                   stdout=asyncio.subprocess.PIPE,
+                                                   stderr=asyncio.subprocess.PIPE)
+    killed = False
+    result = {}
+    try:
+        _, result, _ = await asyncio.wait_for(
+            asyncio.gather(_copy_stream(process.stdout, match.playback_file), _read_result(process.stderr),
+                           process.wait()),
+            timeout)
+    except asyncio.TimeoutError:
+        killed = True
+    finally:
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+
+    winner = result.get('winner', 0 if 'draw' in result else None)
+    return MatchOutcome(match, winner, result.get('timed_out'), result.get('crashed'), killed, process.returncode,
+                        perf_counter() - start)
+
+
+async def _run_all(matches, concurrency, timeout, max_turns, turn_time):
+    slots = asyncio.Semaphore(concurrency)
+
+    async def run_in_slot(match):
+        async with slots:
+            return await run_match(match, timeout, max_turns, turn_time)
+
+    return await asyncio.gather(*(run_in_slot(match) for match in matches))
+
+
+def run_matches(matches, concurrency=None, timeout=None, max_turns=1000, turn_time=1000):
+    """
+        Plays every match with at most concurrency (default: one per core) running at once and returns their
+        MatchOutcomes in the same order.
+    """
+    return asyncio.run(_run_all(matches, concurrency or os.cpu_count(), timeout, max_turns, turn_time))
+
+
+def show_match(match, max_turns=1000, turn_time=1000):
+    """ Plays a match and pipes its playback straight into ShowGame, waiting for both to exit. """
+    _make_dirs(match)
+    playgame = subprocess.Popen(playgame_command(match, max_turns, turn_time), stdout=subprocess.PIPE)
+    try:
+        subprocess.run(SHOWGAME, stdin=playgame.stdout)
+    finally:
+        playgame.stdout.close()
+        if playgame.poll() is None:
+            playgame.kill()
+        playgame.wait()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 4:
+        print('usage: python match_runner.py <bot.py> <opponent_bot.py> <map_num> [<map_num> ...]')
+        sys.exit(1)
+    matches = [make_match(sys.argv[1], sys.argv[2], int(map_num)) for map_num in sys.argv[3:]]
+    for outcome in run_matches(matches):
+        print(outcome)
@@ -1,12 +1,9 @@
 #!/usr/bin/env python
 #
-import logging, traceback, sys, os, inspect
-logging.basicConfig(filename=__file__[:-3] +'.log', filemode='w', level=logging.DEBUG)
-currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
-parentdir = os.path.dirname(currentdir)
-sys.path.append(parentdir)
+import logging, traceback, sys, os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from planet_wars import PlanetWars, issue_order, finish_turn
+from planet_wars import GameStateReader, issue_order, finish_turn
 
 
 def do_turn(state):
@@ -41,16 +38,9 @@ if __name__ == '__main__':
     logging.basicConfig(filename=__file__[:-3] +'.log', filemode='w', level=logging.DEBUG)
 
     try:
-        map_data = ''
-        while True:
-            current_line = input()
-            if len(current_line) >= 2 and current_line.startswith("go"):
-                planet_wars = PlanetWars(map_data)
-                do_turn(planet_wars)
-                finish_turn()
-                map_data = ''
-            else:
-                map_data += current_line + '\n'
+        for planet_wars in GameStateReader():
+            do_turn(planet_wars)
+            finish_turn(planet_wars)
 
     except KeyboardInterrupt:
         print('ctrl-c, leaving ...')
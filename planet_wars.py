@@ -2,13 +2,59 @@
 #
 
 from math import ceil, sqrt
+from array import array
 from collections import namedtuple
-from sys import stdout
+from functools import lru_cache
+from sys import stdin, stdout
 import logging
 
-blackboard = {}
+class Blackboard:
+    """
+    Shared memory for the behavior tree, with one slot per declared key. Read keys as attributes
+    (blackboard.capture_target) in hot code, or by name (blackboard["capture_target"], .get, in) from nodes that are
+    given the key as a string. Unset keys read as None and undeclared keys raise AttributeError.
 
-def get_blackboard() -> dict:
+    Keys in TURN_KEYS only describe the current turn's decisions and are cleared by reset_turn() at the start of every
+    turn, so nothing is read back stale from the previous turn. Keys in GAME_KEYS last until reset_game().
+    """
+    TURN_KEYS = ('capture_target', 'strongest_ally_planets', 'muster_ally', 'order', 'orders', 'attack_strength',
+                 'attack_max_arrival_time', 'attacked_neutral_planet_stack', 'attacked_neutral_planet')
+    GAME_KEYS = ()
+    __slots__ = TURN_KEYS + GAME_KEYS
+
+    def __init__(self):
+        self.reset_game()
+
+    def reset_turn(self):
+        for key in self.TURN_KEYS:
+            object.__setattr__(self, key, None)
+
+    def reset_game(self):
+        for key in self.__slots__:
+            object.__setattr__(self, key, None)
+
+    # Item access maps straight onto the slot descriptors, without a Python-level call
+    __getitem__ = object.__getattribute__
+    __setitem__ = object.__setattr__
+
+    def get(self, key, default=None):
+        value = getattr(self, key)
+        return default if value is None else value
+
+    def setdefault(self, key, default=None):
+        value = getattr(self, key)
+        if value is None:
+            setattr(self, key, default)
+            value = default
+        return value
+
+    def __contains__(self, key):
+        return getattr(self, key, None) is not None
+
+
+blackboard = Blackboard()
+
+def get_blackboard() -> Blackboard:
     return blackboard
 
 def issue_order(state, source_planet_ID, destination_planet_ID, fleet_num_ships):
@@ -20,21 +66,33 @@ def issue_order(state, source_planet_ID, destination_planet_ID, fleet_num_ships)
 
     # Update state
     distance = state.distance(source_planet_ID, destination_planet_ID)
-    state.fleets.append(Fleet(1, fleet_num_ships, source_planet_ID, destination_planet_ID, distance, distance))
-    state.planets[source_planet_ID] = planet._replace(num_ships =planet.num_ships - fleet_num_ships)
+    state.add_fleet(Fleet(1, fleet_num_ships, source_planet_ID, destination_planet_ID, distance, distance))
+    state.update_planet(planet._replace(num_ships =planet.num_ships - fleet_num_ships))
+    state.issued_orders.append((source_planet_ID, destination_planet_ID, fleet_num_ships))
+    state.version += 1
 
-    # Send order
+    # Buffer order, finish_turn sends the turn's orders together
     logging.debug("Order:" + ' '.join([str(source_planet_ID), str(destination_planet_ID), str(fleet_num_ships)]))
-    stdout.write("%d %d %d\n" % (source_planet_ID, destination_planet_ID, fleet_num_ships))
-    stdout.flush()
+    key = (source_planet_ID, destination_planet_ID)
+    state.order_buffer[key] = state.order_buffer.get(key, 0) + fleet_num_ships
     return True
 
 
-def finish_turn():
-    # Must pass "go" to game.
+def finish_turn(state=None):
+    # Must pass "go" to game. The state's buffered orders go out in the same write.
+    # A state built with output=None (simulator, replay, benchmark) is not talking to an engine, so nothing is written.
     logging.debug('Finish turn\n')
-    stdout.write("go\n")
-    stdout.flush()
+    output = stdout
+    lines = []
+    if state is not None:
+        output = state.output
+        lines = ["%d %d %d\n" % order for order in state.buffered_orders()]
+        state.order_buffer.clear()
+    if output is None:
+        return
+    lines.append("go\n")
+    output.write(''.join(lines))
+    output.flush()
 
 
 Fleet = namedtuple('Fleet', ['owner', 'num_ships', 'source_planet', 'destination_planet', 'total_trip_length',
@@ -42,30 +100,284 @@ Fleet = namedtuple('Fleet', ['owner', 'num_ships', 'source_planet', 'destination
 
 Planet = namedtuple('Planet', ['ID', 'x', 'y', 'owner', 'num_ships', 'growth_rate'])
 
+# Struct-of-arrays NumPy view of a PlanetWars state, see PlanetWars.arrays()
+StateArrays = namedtuple('StateArrays', ['planet_owner', 'planet_ships', 'planet_growth', 'planet_x', 'planet_y',
+                                         'fleet_owner', 'fleet_ships', 'fleet_source', 'fleet_destination',
+                                         'fleet_turns_remaining', 'distances'])
+
+
+def resolve_battle(owner, num_ships, arrivals):
+    """
+    Applies the Planet Wars battle rules to a single planet.
+    The largest force wins and keeps the difference to the second largest force, a tie for the lead
+    leaves the planet with its previous owner and no ships.
+
+    Parameters:
+        owner (int): The current owner of the planet
+        num_ships (int): The ships currently on the planet
+        arrivals (dict): Player ID -> number of ships landing on the planet this turn
+
+    Returns:
+        (int, int): The owner and ship count of the planet after the battle
+    """
+    forces = {owner: num_ships}
+    for player_id, ships in arrivals.items():
+        forces[player_id] = forces.get(player_id, 0) + ships
+
+    winner, winner_ships, second_ships = 0, 0, 0
+    for player_id in sorted(forces):
+        ships = forces[player_id]
+        if ships > second_ships:
+            if ships > winner_ships:
+                second_ships = winner_ships
+                winner, winner_ships = player_id, ships
+            else:
+                second_ships = ships
+
+    if winner_ships > second_ships:
+        return winner, winner_ships - second_ships
+    return owner, 0
+
+
+@lru_cache(maxsize=16)
+def distance_table(positions):
+    """
+    Computes the travel time between every pair of planets. Planets never move, so the result is cached per map and
+    shared by every state built during a game.
+
+    Parameters:
+        positions (tuple): The (x, y) position of each planet, indexed by planet ID
+
+    Returns:
+        (array, tuple): A flat array('i') where [source * num_planets + destination] is the distance, and for each
+            planet a tuple of the other planet IDs sorted nearest first (ties by ID)
+    """
+    num_planets = len(positions)
+    distances = array('i', bytes(4 * num_planets * num_planets))
+    for source, (source_x, source_y) in enumerate(positions):
+        row = source * num_planets
+        for destination, (destination_x, destination_y) in enumerate(positions):
+            dx = source_x - destination_x
+            dy = source_y - destination_y
+            distances[row + destination] = int(ceil(sqrt(dx * dx + dy * dy)))
+    neighbours = tuple(
+        tuple(sorted((other for other in range(num_planets) if other != source),
+                     key=lambda other: distances[source * num_planets + other]))
+        for source in range(num_planets))
+    return distances, neighbours
+
+
+class PlanetForecast:
+    """
+    The owner and ship count of one planet on every turn until the last fleet currently heading to it has landed,
+    simulated once with the engine rules (growth, then arrivals and battle). Later turns are extrapolated from the
+    final owner's growth.
+    """
+    __slots__ = ('growth_rate', 'arrivals', 'owners', 'ships')
+
+    def __init__(self, planet, fleets):
+        self.growth_rate = planet.growth_rate
+        # Turn -> {owner: ships landing that turn}
+        self.arrivals = {}
+        for fleet in fleets:
+            landing = self.arrivals.setdefault(fleet.turns_remaining, {})
+            landing[fleet.owner] = landing.get(fleet.owner, 0) + fleet.num_ships
+        self.owners = [planet.owner]
+        self.ships = [planet.num_ships]
+        self._simulate(0)
+
+    def _simulate(self, start_turn):
+        # Recompute every turn after start_turn, keeping the timeline up to and including it
+        del self.owners[start_turn + 1:], self.ships[start_turn + 1:]
+        owner, num_ships = self.owners[start_turn], self.ships[start_turn]
+        for turn in range(start_turn + 1, max(self.arrivals, default=0) + 1):
+            if owner > 0:
+                num_ships += self.growth_rate
+            landing = self.arrivals.get(turn)
+            if landing:
+                owner, num_ships = resolve_battle(owner, num_ships, landing)
+            self.owners.append(owner)
+            self.ships.append(num_ships)
+
+    def add_fleet(self, fleet):
+        """ Adds a fleet heading to this planet, re-simulating only the turns from its arrival on. """
+        landing = self.arrivals.setdefault(fleet.turns_remaining, {})
+        landing[fleet.owner] = landing.get(fleet.owner, 0) + fleet.num_ships
+        # A fleet with no turns remaining (an order to its own source planet) never lands, like in __init__
+        self._simulate(max(min(fleet.turns_remaining - 1, len(self.owners) - 1), 0))
+
+    def update_planet(self, planet):
+        """ Replaces the planet's current owner and ship count and re-simulates the timeline from them. """
+        self.owners[0] = planet.owner
+        self.ships[0] = planet.num_ships
+        self._simulate(0)
+
+    @property
+    def horizon(self):
+        """ The turn on which the last known fleet lands. """
+        return len(self.owners) - 1
+
+    def owner(self, turn):
+        return self.owners[min(max(turn, 0), len(self.owners) - 1)]
+
+    def num_ships(self, turn):
+        turn = max(turn, 0)
+        if turn < len(self.ships):
+            return self.ships[turn]
+        owner = self.owners[-1]
+        return self.ships[-1] + (self.growth_rate * (turn - len(self.ships) + 1) if owner > 0 else 0)
+
 
 class PlanetWars:
-    def __init__(self, game_state):
+    def __init__(self, game_state, output=stdout):
         self.planets = []
         self.fleets = []
+        # Orders issued this turn as (source, destination, num_ships)
+        self.issued_orders = []
+        # The same orders merged per (source, destination) pair, written to output by finish_turn unless it is None
+        self.order_buffer = {}
+        self.output = output
+        # Bumped by issue_order so memoized queries made before an order are recomputed after it
+        self.version = 0
+        self.query_cache = {}
+        # The distance_table result for these planets, looked up by _build_index unless given to from_objects
+        self._tables = None
         parse_game_state(self, game_state)
+        self._build_index()
+
+    @classmethod
+    def from_objects(cls, planets, fleets, output=stdout, tables=None):
+        """
+        Builds a state directly from Planet and Fleet tuples instead of engine text. tables, if given, is the
+        distance_table result for these planets, for engines that keep it per game rather than rely on its cache.
+        """
+        pw_instance = cls('', output)
+        pw_instance.planets = list(planets)
+        pw_instance.fleets = list(fleets)
+        pw_instance._tables = tables
+        pw_instance._build_index()
+        return pw_instance
+
+    def buffered_orders(self):
+        """ The turn's orders as sent to the engine: (source, destination, num_ships) with duplicate pairs merged. """
+        return [(source, destination, num_ships) for (source, destination), num_ships in self.order_buffer.items()]
+
+    def _build_index(self):
+        self._arrays = None
+        self._forecasts = {}
+        self._num_planets = len(self.planets)
+        if self._tables is None:
+            self._tables = distance_table(tuple((p.x, p.y) for p in self.planets))
+        self._distances, self._neighbours = self._tables
+
+        # Planets partitioned by owner (and the not-mine union), each in planet ID order
+        self._planets_by_owner = {0: [], 1: [], 2: []}
+        self._not_my_planets = []
+        # Planet ID -> (position in its owner list, position in the not-mine list)
+        self._planet_positions = {}
+        for planet in self.planets:
+            owner_planets = self._planets_by_owner.setdefault(planet.owner, [])
+            not_mine_position = None
+            if planet.owner != 1:
+                not_mine_position = len(self._not_my_planets)
+                self._not_my_planets.append(planet)
+            self._planet_positions[planet.ID] = (len(owner_planets), not_mine_position)
+            owner_planets.append(planet)
+
+        self._fleets_by_owner = {1: [], 2: []}
+        # (destination planet ID, owner) -> fleets in arrival-list order
+        self._fleets_to = {}
+        for fleet in self.fleets:
+            self._index_fleet(fleet)
+
+    def _index_fleet(self, fleet):
+        self._fleets_by_owner.setdefault(fleet.owner, []).append(fleet)
+        self._fleets_to.setdefault((fleet.destination_planet, fleet.owner), []).append(fleet)
+
+    def add_fleet(self, fleet):
+        """ Appends a fleet to the state and the fleet indexes. """
+        self.fleets.append(fleet)
+        self._index_fleet(fleet)
+        self._arrays = None
+        forecast = self._forecasts.get(fleet.destination_planet)
+        if forecast is not None:
+            forecast.add_fleet(fleet)
+
+    def update_planet(self, planet):
+        """ Replaces the planet with the same ID, keeping the owner partitions up to date. """
+        previous = self.planets[planet.ID]
+        self.planets[planet.ID] = planet
+        self._arrays = None
+        if previous.owner != planet.owner:
+            self._build_index()
+            return
+        forecast = self._forecasts.get(planet.ID)
+        if forecast is not None:
+            forecast.update_planet(planet)
+        owner_position, not_mine_position = self._planet_positions[planet.ID]
+        self._planets_by_owner[planet.owner][owner_position] = planet
+        if not_mine_position is not None:
+            self._not_my_planets[not_mine_position] = planet
 
     def my_planets(self):
-        return [planet for planet in self.planets if planet.owner == 1]
+        return list(self._planets_by_owner[1])
 
     def neutral_planets(self):
-        return [planet for planet in self.planets if planet.owner == 0]
+        return list(self._planets_by_owner[0])
 
     def enemy_planets(self):
-        return [planet for planet in self.planets if planet.owner == 2]
+        return list(self._planets_by_owner[2])
 
     def not_my_planets(self):
-        return [planet for planet in self.planets if planet.owner != 1]
+        return list(self._not_my_planets)
 
     def my_fleets(self):
-        return [fleet for fleet in self.fleets if fleet.owner == 1]
+        return list(self._fleets_by_owner[1])
 
     def enemy_fleets(self):
-        return [fleet for fleet in self.fleets if fleet.owner == 2]
+        return list(self._fleets_by_owner[2])
+
+    def arrays(self):
+        """
+        Returns a StateArrays view of the planets and fleets as NumPy arrays indexed by planet ID / fleet position,
+        or None when NumPy is not installed. The view is built on first use and rebuilt after the state changes.
+        """
+        if self._arrays is None:
+            try:
+                import numpy
+            except ImportError:
+                return None
+            _, planet_x, planet_y, planet_owner, planet_ships, planet_growth = \
+                zip(*self.planets) if self.planets else ((),) * 6
+            fleet_owner, fleet_ships, fleet_source, fleet_destination, _, fleet_turns_remaining = \
+                zip(*self.fleets) if self.fleets else ((),) * 6
+            self._arrays = StateArrays(
+                numpy.array(planet_owner, dtype=numpy.int64), numpy.array(planet_ships),
+                numpy.array(planet_growth, dtype=numpy.int64), numpy.array(planet_x, dtype=numpy.float64),
+                numpy.array(planet_y, dtype=numpy.float64), numpy.array(fleet_owner, dtype=numpy.int64),
+                numpy.array(fleet_ships), numpy.array(fleet_source, dtype=numpy.int64),
+                numpy.array(fleet_destination, dtype=numpy.int64),
+                numpy.array(fleet_turns_remaining, dtype=numpy.int64),
+                numpy.frombuffer(self._distances, dtype=numpy.intc).reshape(self._num_planets, self._num_planets))
+        return self._arrays
+
+    def forecast(self, planet_id):
+        """
+        Returns the PlanetForecast for a planet. It is simulated on first use and afterwards patched in place by
+        add_fleet and update_planet, so issuing an order only re-simulates the source and destination planets.
+        """
+        forecast = self._forecasts.get(planet_id)
+        if forecast is None:
+            fleets = [fleet for owner in (1, 2) for fleet in self.fleets_to(planet_id, owner)]
+            forecast = self._forecasts[planet_id] = PlanetForecast(self.planets[planet_id], fleets)
+        return forecast
+
+    def fleets_to(self, planet_id, owner):
+        """
+        Returns the fleets owned by owner that are heading to the planet, in the order they appear in self.fleets.
+        The sequence is shared with the index, so callers must not modify it.
+        """
+        return self._fleets_to.get((planet_id, owner), ())
 
     def __str__(self):
         s = ''
@@ -79,15 +391,14 @@ class PlanetWars:
         return s
 
     def distance(self, source_planet, destination_planet):
-        source = self.planets[source_planet]
-        destination = self.planets[destination_planet]
-        dx = source.x - destination.x
-        dy = source.y - destination.y
-        return int(ceil(sqrt(dx * dx + dy * dy)))
+        return self._distances[source_planet * self._num_planets + destination_planet]
+
+    def neighbours(self, planet_id):
+        """ Returns the IDs of all other planets, nearest first. """
+        return self._neighbours[planet_id]
 
     def is_alive(self, player_id):
-        return any(planet.owner == player_id for planet in self.planets) or \
-                any(fleet.owner == player_id for fleet in self.fleets)
+        return bool(self._planets_by_owner.get(player_id)) or bool(self._fleets_by_owner.get(player_id))
 
 
 def parse_game_state(pw_instance, state):
@@ -101,7 +412,8 @@ def parse_game_state(pw_instance, state):
         params = line.split(' ')[1:]
         assert len(params) == 5, 'Wrong planet specification: ' + line
 
-        p = Planet(planet_id, *map(float, params))
+        x, y, owner, num_ships, growth_rate = params
+        p = Planet(planet_id, float(x), float(y), int(owner), int(num_ships), int(growth_rate))
         pw_instance.planets.append(p)
 
     for line in fleet_lines:
@@ -111,3 +423,101 @@ def parse_game_state(pw_instance, state):
 
         f = Fleet(*map(int, params))
         pw_instance.fleets.append(f)
+
+
+def serialize_game_state(pw_instance):
+    """ Writes a state back out in the engine's text format, which parse_game_state reads. """
+    lines = ['P %r %r %d %d %d' % (p.x, p.y, p.owner, p.num_ships, p.growth_rate) for p in pw_instance.planets]
+    lines.extend('F %d %d %d %d %d %d' % f for f in pw_instance.fleets)
+    return '\n'.join(lines)
+
+
+class GameStateReader:
+    """
+    Reads the engine's turns from a byte stream (stdin by default) and yields one PlanetWars per "go".
+    Input is read in large chunks rather than line by line. Positions and growth rates never change, so the
+    planet table from the previous turn is reused and only owners and ship counts are updated; fleets are re-read.
+    """
+    def __init__(self, stream=None, output=stdout):
+        self.stream = stream if stream is not None else stdin.buffer
+        self.output = output
+        self.planets = None
+
+    def __iter__(self):
+        pending = b''
+        planet_lines, fleet_lines = [], []
+        while True:
+            chunk = self.stream.read1(1 << 16)
+            if not chunk:
+                return
+            lines = (pending + chunk).split(b'\n')
+            pending = lines.pop()
+            for line in lines:
+                if line.startswith(b'P'):
+                    planet_lines.append(line)
+                elif line.startswith(b'F'):
+                    fleet_lines.append(line)
+                elif line.startswith(b'go'):
+                    yield self._build_state(planet_lines, fleet_lines)
+                    planet_lines, fleet_lines = [], []
+
+    def _build_state(self, planet_lines, fleet_lines):
+        if self.planets is None or len(self.planets) != len(planet_lines):
+            self.planets = []
+            for planet_id, line in enumerate(planet_lines):
+                params = line.split(b'#')[0].split()[1:]
+                assert len(params) == 5, 'Wrong planet specification: ' + line.decode()
+                x, y, owner, num_ships, growth_rate = params
+                self.planets.append(Planet(planet_id, float(x), float(y), int(owner), int(num_ships),
+                                           int(growth_rate)))
+        else:
+            planets = self.planets
+            for planet_id, line in enumerate(planet_lines):
+                params = line.split(b'#')[0].split()
+                owner, num_ships = int(params[3]), int(params[4])
+                planet = planets[planet_id]
+                if planet.owner != owner or planet.num_ships != num_ships:
+                    planets[planet_id] = planet._replace(owner=owner, num_ships=num_ships)
+
+        fleets = []
+        for line in fleet_lines:
+            params = line.split(b'#')[0].split()[1:]
+            assert len(params) == 6, 'Wrong fleet specification: ' + line.decode()
+            fleets.append(Fleet(*map(int, params)))
+
+        return PlanetWars.from_objects(self.planets, fleets, self.output)
+
+
+class GameRecorder:
+    """
+    Records every turn of a game as one JSON line: the state as received, the orders issued for it and how long the
+    turn took. Each line is flushed as soon as the turn ends, so the file survives the engine killing the bot.
+    Read it back with replay.py.
+    """
+    def __init__(self, path):
+        self.file = open(path, 'w')
+        self.turn = 0
+        self.state_text = None
+
+    def start_turn(self, state):
+        # Taken before do_turn, which updates the state as orders are issued
+        self.state_text = serialize_game_state(state)
+
+    def end_turn(self, state, elapsed_ms):
+        import json  # Only needed when recording
+        self.file.write(json.dumps({'turn': self.turn, 'ms': round(elapsed_ms, 3), 'state': self.state_text,
+                                    'orders': state.issued_orders}) + '\n')
+        self.file.flush()
+        self.turn += 1
+
+    def close(self):
+        self.file.close()
+
+
+def read_recording(path):
+    """ Yields the records written by GameRecorder in turn order. """
+    import json
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+#
+"""
+    Streaming parser for the playback data PlayGame.jar writes to stdout (and ShowGame.jar reads).
+
+    The playback is one long line: the starting planets as "x,y,owner,ships,growth" joined by ':', then '|', then one
+    entry per turn joined by ':'. A turn lists every planet as "owner.ships" followed by every fleet in flight as
+    "owner.ships.source.destination.total_turns.turns_remaining", all joined by ','.
+
+    The file is read in chunks and each turn is reduced to player totals as soon as it is complete, so memory stays
+    flat however long the game or however many games are summarized.
+
+    usage: python playback.py <playback file> [<playback file> ...] [--json results.json]
+"""
+import json
+import sys
+from collections import namedtuple
+from multiprocessing import Pool
+
+from planet_wars import Planet
+
+# Per-player values are (player 1, player 2) pairs
+TurnStats = namedtuple('TurnStats', ['turn', 'ships', 'fleet_ships', 'planets', 'production'])
+MatchSummary = namedtuple('MatchSummary', ['winner', 'turns', 'final_ships', 'final_planets', 'final_production',
+                                           'peak_ships', 'turns_ahead', 'lead_changes'])
+
+
+class PlaybackReader:
+    """
+    Iterates over a playback stream one TurnStats at a time, starting with the initial state as turn 0.
+    The starting planets are available as .planets once iteration has begun.
+    """
+    def __init__(self, stream, chunk_size=1 << 16):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.planets = None
+
+    def _entries(self):
+        """ Yields (in_header, entry) for each ':' separated entry, splitting the header from the turns at '|'. """
+        pending = b''
+        in_header = True
+        while True:
+            chunk = self.stream.read(self.chunk_size)
+            if not chunk:
+                break
+            entries = (pending + chunk).split(b':')
+            pending = entries.pop()
+            for entry in entries:
+                if in_header and b'|' in entry:
+                    last_planet, entry = entry.split(b'|', 1)
+                    yield True, last_planet
+                    in_header = False
+                yield in_header, entry
+        pending = pending.strip()
+        if in_header and b'|' in pending:
+            last_planet, pending = pending.split(b'|', 1)
+            yield True, last_planet
+            in_header = False
+        if pending:
+            yield in_header, pending
+
+    def __iter__(self):
+        planets = []
+        turn = 0
+        for in_header, entry in self._entries():
+            if in_header:
+                x, y, owner, num_ships, growth_rate = entry.strip().split(b',')
+                planets.append(Planet(len(planets), float(x), float(y), int(owner), int(num_ships),
+                                      int(growth_rate)))
+                continue
+            if self.planets is None:
+                self.planets = planets
+                yield self._turn_stats(0, [p.owner for p in planets], [p.num_ships for p in planets], [])
+            turn += 1
+            owners, ships, fleets = [], [], []
+            for item in entry.split(b','):
+                fields = item.split(b'.')
+                if len(fields) == 2:
+                    owners.append(int(fields[0]))
+                    ships.append(int(fields[1]))
+                elif len(fields) == 6:
+                    fleets.append((int(fields[0]), int(fields[1])))
+            yield self._turn_stats(turn, owners, ships, fleets)
+        if self.planets is None and planets:
+            # A game that ended before its first turn
+            self.planets = planets
+            yield self._turn_stats(0, [p.owner for p in planets], [p.num_ships for p in planets], [])
+
+    def _turn_stats(self, turn, owners, ships, fleets):
+        total_ships = [0, 0, 0]
+        fleet_ships = [0, 0, 0]
+        num_planets = [0, 0, 0]
+        production = [0, 0, 0]
+        for planet, owner, num_ships in zip(self.planets, owners, ships):
+            total_ships[owner] += num_ships
+            num_planets[owner] += 1
+            production[owner] += planet.growth_rate
+        for owner, num_ships in fleets:
+            total_ships[owner] += num_ships
+            fleet_ships[owner] += num_ships
+        return TurnStats(turn, tuple(total_ships[1:]), tuple(fleet_ships[1:]), tuple(num_planets[1:]),
+                         tuple(production[1:]))
+
+
+def summarize(turn_stats):
+    """
+    Folds a stream of TurnStats into a MatchSummary. The winner is read off the last turn: the only player with ships
+    left, otherwise whoever has more (0 for a draw). Games lost by a crash or timeout are not visible in the playback.
+    """
+    last = None
+    peak_ships = [0, 0]
+    turns_ahead = [0, 0]
+    lead_changes = 0
+    leader = 0
+    for stats in turn_stats:
+        last = stats
+        ships = stats.ships
+        peak_ships = [max(peak_ships[0], ships[0]), max(peak_ships[1], ships[1])]
+        if ships[0] != ships[1]:
+            current = 1 if ships[0] > ships[1] else 2
+            turns_ahead[current - 1] += 1
+            if leader and current != leader:
+                lead_changes += 1
+            leader = current
+    if last is None:
+        return None
+
+    ships = last.ships
+    winner = 0 if ships[0] == ships[1] else (1 if ships[0] > ships[1] else 2)
+    return MatchSummary(winner, last.turn, ships, last.planets, last.production, tuple(peak_ships),
+                        tuple(turns_ahead), lead_changes)
+
+
+def summarize_file(path):
+    with open(path, 'rb') as f:
+        return summarize(PlaybackReader(f))
+
+
+def summarize_files(paths, processes=None):
+    """ Summarizes many playback files in parallel. Returns (path, MatchSummary) pairs in the given order. """
+    with Pool(processes) as pool:
+        return list(zip(paths, pool.imap(summarize_file, paths, chunksize=4)))
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    results_file = None
+    if '--json' in args:
+        index = args.index('--json')
+        results_file = args[index + 1]
+        del args[index:index + 2]
+    if not args:
+        print('usage: python playback.py <playback file> [<playback file> ...] [--json results.json]')
+        sys.exit(1)
+
+    summaries = summarize_files(args) if len(args) > 1 else [(args[0], summarize_file(args[0]))]
+    for path, summary in summaries:
+        print(path, summary)
+    if results_file is not None:
+        with open(results_file, 'w') as f:
+            json.dump({path: summary._asdict() if summary else None for path, summary in summaries}, f, indent=2)
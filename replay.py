@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+#
+"""
+    Replays a game recorded by bt_bot (run it with BT_RECORD=1) through a bot's do_turn, one recorded state at a time.
+    Every turn is checked against the orders issued when it was recorded, and the slowest turns are listed so they
+    can be profiled offline.
+
+    The lookahead only repeats its choices if it plays a fixed number of rollouts, so record with
+    BT_LOOKAHEAD_ROLLOUTS=N and replay with --rollouts N; otherwise turns it decided may show up as mismatches.
+
+    usage: python replay.py <record.jsonl> [--bot behavior_tree_bot/bt_bot.py] [--turn N] [--repeats R] [--top K]
+                            [--profile] [--rollouts N]
+"""
+import argparse
+import sys
+from time import perf_counter
+
+import simulator
+from planet_wars import PlanetWars, get_blackboard, read_recording
+
+
+def replay_turn(bot, record):
+    """ Runs one recorded state through the bot. Returns the orders it issued and the time taken in ms. """
+    state = PlanetWars(record['state'], output=None)
+    get_blackboard().reset_game()
+    start = perf_counter()
+    bot.do_turn(state)
+    return state.issued_orders, (perf_counter() - start) * 1000
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Replay a recorded bt_bot game.')
+    parser.add_argument('recording')
+    parser.add_argument('--bot', default='behavior_tree_bot/bt_bot.py')
+    parser.add_argument('--turn', type=int, default=None, help='only replay this turn')
+    parser.add_argument('--repeats', type=int, default=1, help='runs per turn, the fastest is reported')
+    parser.add_argument('--top', type=int, default=5, help='number of slowest turns to list')
+    parser.add_argument('--profile', action='store_true', help='time every tree node and print the annotated tree')
+    parser.add_argument('--rollouts', type=int, default=None,
+                        help='play this many lookahead rollouts instead of a time slice, as recorded')
+    args = parser.parse_args()
+
+    bot = simulator.load_bot(args.bot)
+    if args.rollouts is not None:
+        bot.LOOKAHEAD_ROLLOUTS = args.rollouts
+    profiler = None
+    if args.profile:
+        # Swap in an instrumented tree; do_turn only builds its own if none is set
+        root = bot.setup_behavior_tree()
+        profiler = bot.Profiler()
+        bot.behavior_tree = bot.compile_tree(root, profiler)
+
+    records = [r for r in read_recording(args.recording) if args.turn is None or r['turn'] == args.turn]
+    if not records:
+        print('No matching turns in', args.recording)
+        sys.exit(1)
+
+    timings = []
+    mismatches = []
+    for record in records:
+        best = None
+        for _ in range(args.repeats):
+            orders, elapsed = replay_turn(bot, record)
+            best = elapsed if best is None else min(best, elapsed)
+        timings.append((best, record['turn'], record['ms']))
+        if [list(order) for order in orders] != record['orders']:
+            mismatches.append(record['turn'])
+
+    print('Replayed %d turns, %d with different orders than recorded' % (len(records), len(mismatches)))
+    if mismatches:
+        print('  turns:', ' '.join(map(str, mismatches)))
+    print('Slowest turns (replayed ms / recorded ms):')
+    for elapsed, turn, recorded in sorted(timings, reverse=True)[:args.top]:
+        print('  turn %4d  %8.2f  %8.2f' % (turn, elapsed, recorded))
+
+    if profiler is not None:
+        print(profiler.annotated_tree(root))
+    sys.exit(1 if mismatches else 0)
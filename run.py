@@ -1,5 +1,12 @@
-import subprocess
 import os, sys
+import glob, json, logging
+from multiprocessing import Pool
+
+import match_runner
+import simulator
+
+# Seconds before a PlayGame match is killed: 1000 turns of up to 1 s for each bot, plus start-up
+MATCH_TIMEOUT = 2100
 
 
 def show_match(bot, opponent_bot, map_num):
@@ -7,49 +14,121 @@ def show_match(bot, opponent_bot, map_num):
         Runs an instance of Planet Wars between the two given bots on the specified map. After completion, the
         game is replayed via a visual interface.
     """
-    command = 'java -jar tools/PlayGame.jar maps/map' + str(map_num) + '.txt 1000 1000 log.txt ' + \
-              '"python ' + bot + '" ' + \
-              '"python ' + opponent_bot + '" ' + \
-              '| java -jar tools/ShowGame.jar'
-    print(command)
-    os.system(command)
+    match = match_runner.make_match(bot, opponent_bot, map_num)
+    print(' '.join(match_runner.playgame_command(match)), '|', ' '.join(match_runner.SHOWGAME))
+    match_runner.show_match(match)
+
+
+def _report(outcome):
+    names = {1: _bot_name(outcome.match.bot), 2: _bot_name(outcome.match.opponent_bot)}
+    if outcome.killed:
+        print(names[1], 'vs', names[2], 'on map', outcome.match.map_num, 'did not finish in time.')
+    elif outcome.timed_out:
+        print(names[outcome.timed_out], 'timed out.')
+    elif outcome.crashed:
+        print(names[outcome.crashed], 'crashed.')
+    elif outcome.winner:
+        print(names[outcome.winner], 'wins!')
+    elif outcome.winner == 0:
+        print('Draw.')
+    else:
+        print('No result from PlayGame (exit code %s), see %s' % (outcome.returncode, outcome.match.log_file))
+
+
+def _bot_name(bot):
+    return bot.split('/')[1].split('.')[0]
 
 
 def test(bot, opponent_bot, map_num):
     """ Runs an instance of Planet Wars between the two given bots on the specified map. """
-    bot_name, opponent_name = bot.split('/')[1].split('.')[0], opponent_bot.split('/')[1].split('.')[0]
-    print('Running test:',bot_name,'vs',opponent_name)
-    command = 'java -jar tools/PlayGame.jar maps/map' + str(map_num) +'.txt 1000 1000 log.txt ' + \
-              '"python ' + bot + '" ' + \
-              '"python ' + opponent_bot + '" '
-
-    print(command)
-    p = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, shell=True)
-
-    while True:
-        return_code = p.poll()  # returns None while subprocess is running
-        line = p.stdout.readline().decode('utf-8')
-        if '1 timed out' in line:
-            print(bot_name,'timed out.')
-            break
-        elif '2 timed out' in line:
-            print(opponent_name,'timed out.')
-            break
-        elif '1 crashed' in line:
-            print(bot_name, 'crashed.')
-            break
-        elif '2 crashed' in line:
-            print(opponent_name, 'crashed')
-            break
-        elif 'Player 1 Wins!' in line:
-            print(bot_name,'wins!')
-            break
-        elif 'Player 2 Wins!' in line:
-            print(opponent_name,'wins!')
-            break
-
-        if return_code is not None:
-            break
+    test_all(bot, [(opponent_bot, map_num)])
+
+
+def test_all(bot, games, concurrency=None, timeout=MATCH_TIMEOUT):
+    """
+        Runs PlayGame matches of the bot against each (opponent_bot, map_num) pair, several at once, and reports each
+        result. Playback and engine logs are kept under matches/ for playback.py.
+    """
+    matches = [match_runner.make_match(bot, opponent_bot, map_num) for opponent_bot, map_num in games]
+    for match in matches:
+        print('Running test:', _bot_name(match.bot), 'vs', _bot_name(match.opponent_bot), 'on map', match.map_num)
+    outcomes = match_runner.run_matches(matches, concurrency, timeout)
+    for outcome in outcomes:
+        _report(outcome)
+    return outcomes
+
+
+def simulate(bot, opponent_bot, map_num):
+    """ Plays the same match as test() with the in-process simulator instead of PlayGame.jar. """
+    bot_name, opponent_name = _bot_name(bot), _bot_name(opponent_bot)
+    print('Simulating:', bot_name, 'vs', opponent_name, 'on map', map_num)
+    result = simulator.play_match(bot, opponent_bot, 'maps/map' + str(map_num) + '.txt')
+    names = {1: bot_name, 2: opponent_name}
+    if result.timed_out:
+        print(names[result.timed_out], 'timed out.')
+    elif result.crashed:
+        print(names[result.crashed], 'crashed.')
+    elif result.winner:
+        print(names[result.winner], 'wins!')
+    else:
+        print('Draw.')
+
+
+def _quiet_worker():
+    # Bot logging would make every worker fight over the same log files
+    logging.disable(logging.CRITICAL)
+
+
+def _tournament_game(match):
+    bot, opponent_bot, map_num = match
+    result = simulator.play_match(bot, opponent_bot, 'maps/map' + str(map_num) + '.txt')
+    return {'opponent': _bot_name(opponent_bot), 'map': map_num, 'winner': result.winner,
+            'turns': result.turns, 'timed_out': result.timed_out, 'crashed': result.crashed,
+            'max_turn_time': result.max_turn_time[0]}
+
+
+def _summarize(games):
+    wins = sum(1 for g in games if g['winner'] == 1)
+    return {'games': len(games),
+            'wins': wins,
+            'losses': sum(1 for g in games if g['winner'] == 2),
+            'draws': sum(1 for g in games if g['winner'] == 0),
+            'win_rate': wins / len(games),
+            'mean_turns': sum(g['turns'] for g in games) / len(games),
+            'timeouts': sum(1 for g in games if g['timed_out'] == 1),
+            'crashes': sum(1 for g in games if g['crashed'] == 1),
+            'max_turn_time': max(g['max_turn_time'] for g in games)}
+
+
+def tournament(bot, results_file='tournament.json', processes=None):
+    """
+        Plays the bot against every opponent in opponent_bots/ on every map with the in-process simulator, spread over
+        a process pool (one worker per core by default). Per-opponent and per-map summaries plus every game result are
+        written to results_file as JSON.
+    """
+    opponents = sorted(path.replace(os.sep, '/') for path in glob.glob('opponent_bots/*.py'))
+    matches = [(bot, opponent, map_num) for opponent in opponents for map_num in range(1, 101)]
+    print('Running tournament:', len(matches), 'games over', processes or os.cpu_count(), 'processes')
+    with Pool(processes, initializer=_quiet_worker) as pool:
+        games = pool.map(_tournament_game, matches, chunksize=4)
+
+    by_opponent, by_map = {}, {}
+    for game in games:
+        by_opponent.setdefault(game['opponent'], []).append(game)
+        by_map.setdefault(game['map'], []).append(game)
+    results = {'bot': bot,
+               'overall': _summarize(games),
+               'opponents': {name: _summarize(g) for name, g in by_opponent.items()},
+               'maps': {map_num: _summarize(g) for map_num, g in sorted(by_map.items())},
+               'games': games}
+    with open(results_file, 'w') as f:
+        json.dump(results, f, indent=1)
+
+    for name, summary in results['opponents'].items():
+        print('%-16s win rate %5.1f%%  timeouts %d  crashes %d' %
+              (name, summary['win_rate'] * 100, summary['timeouts'], summary['crashes']))
+    print('Results written to', results_file)
+    return results
 
 
 if __name__ == '__main__':
@@ -63,11 +142,20 @@ if __name__ == '__main__':
     maps = [71, 13, 24, 56, 7]
 
     my_bot = 'behavior_tree_bot/bt_bot.py'
+    if len(sys.argv) >= 2 and sys.argv[1] == "tournament":
+        # python run.py tournament [results.json]
+        tournament(my_bot, *sys.argv[2:3])
+        sys.exit(0)
     show = len(sys.argv) < 2 or sys.argv[1] == "show"
+    sim = len(sys.argv) >= 2 and sys.argv[1] == "sim"
+    if not show and not sim:
+        # use this command if you just want the results of the matches reported
+        test_all(my_bot, list(zip(opponents, maps)))
+        sys.exit(0)
     for opponent, map in zip(opponents, maps):
         # use this command if you want to observe the bots
         if show:
             show_match(my_bot, opponent, map)
-        else:
-            # use this command if you just want the results of the matches reported
-            test(my_bot, opponent, map)
+        elif sim:
+            # use this command to play the matches in-process, without Java
+            simulate(my_bot, opponent, map)
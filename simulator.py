@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+#
+"""
+    In-process Planet Wars engine. Applies the same rules as tools/PlayGame.jar (departure, growth, fleet
+    advancement and arrival battles) and calls each bot's do_turn directly, so games can be played without Java
+    and without spawning a process per bot.
+"""
+import importlib.util
+import logging
+import os
+import sys
+from collections import namedtuple
+from time import perf_counter
+
+from planet_wars import PlanetWars, Planet, Fleet, distance_table, resolve_battle, get_blackboard
+
+MatchResult = namedtuple('MatchResult', ['winner', 'turns', 'timed_out', 'crashed', 'max_turn_time'])
+
+# Player 2 sees the game with the player IDs swapped, exactly like PlayGame sends it
+SWAPPED_OWNER = (0, 2, 1)
+
+_loaded_bots = {}
+
+
+class Game:
+    def __init__(self, planets, fleets=(), max_turns=1000):
+        self.planets = list(planets)
+        self.fleets = list(fleets)
+        self.max_turns = max_turns
+        self.turn = 0
+        # Computed once per game and handed to every player view
+        self.tables = distance_table(tuple((p.x, p.y) for p in self.planets))
+        self.distances = self.tables[0]
+
+    @classmethod
+    def from_map(cls, map_path, max_turns=1000):
+        with open(map_path) as map_file:
+            state = PlanetWars(map_file.read(), output=None)
+        planets = [Planet(p.ID, p.x, p.y, int(p.owner), int(p.num_ships), int(p.growth_rate))
+                   for p in state.planets]
+        return cls(planets, state.fleets, max_turns)
+
+    def player_view(self, player_id):
+        """ Returns a PlanetWars state as seen by the given player, which always calls itself player 1. """
+        if player_id == 1:
+            return PlanetWars.from_objects(self.planets, self.fleets, output=None, tables=self.tables)
+        planets = [p._replace(owner=SWAPPED_OWNER[p.owner]) for p in self.planets]
+        fleets = [f._replace(owner=SWAPPED_OWNER[f.owner]) for f in self.fleets]
+        return PlanetWars.from_objects(planets, fleets, output=None, tables=self.tables)
+
+    def issue_order(self, player_id, source_planet_ID, destination_planet_ID, fleet_num_ships):
+        """ Launches a fleet for a player. Returns False for an illegal order, which drops the player. """
+        fleet_num_ships = int(fleet_num_ships)
+        if not (0 <= source_planet_ID < len(self.planets) and 0 <= destination_planet_ID < len(self.planets)):
+            return False
+        source = self.planets[source_planet_ID]
+        if source.owner != player_id or fleet_num_ships > source.num_ships or fleet_num_ships < 0:
+            return False
+
+        self.planets[source_planet_ID] = source._replace(num_ships=source.num_ships - fleet_num_ships)
+        distance = self.distances[source_planet_ID * len(self.planets) + destination_planet_ID]
+        self.fleets.append(Fleet(player_id, fleet_num_ships, source_planet_ID, destination_planet_ID,
+                                 distance, distance))
+        return True
+
+    def do_time_step(self):
+        # Growth happens before fleets land, on every non-neutral planet
+        self.planets = [p._replace(num_ships=p.num_ships + p.growth_rate) if p.owner > 0 else p
+                        for p in self.planets]
+
+        arrivals = {}
+        in_flight = []
+        for fleet in self.fleets:
+            fleet = fleet._replace(turns_remaining=fleet.turns_remaining - 1)
+            if fleet.turns_remaining > 0:
+                in_flight.append(fleet)
+            else:
+                landing = arrivals.setdefault(fleet.destination_planet, {})
+                landing[fleet.owner] = landing.get(fleet.owner, 0) + fleet.num_ships
+        self.fleets = in_flight
+
+        for planet_id, landing in arrivals.items():
+            planet = self.planets[planet_id]
+            owner, num_ships = resolve_battle(planet.owner, planet.num_ships, landing)
+            self.planets[planet_id] = planet._replace(owner=owner, num_ships=num_ships)
+
+        self.turn += 1
+
+    def num_ships(self, player_id):
+        return sum(p.num_ships for p in self.planets if p.owner == player_id) + \
+               sum(f.num_ships for f in self.fleets if f.owner == player_id)
+
+    def winner(self):
+        """ Returns -1 while the game is running, 0 for a draw, otherwise the winning player ID. """
+        remaining_players = {p.owner for p in self.planets} | {f.owner for f in self.fleets}
+        remaining_players.discard(0)
+        if self.turn > self.max_turns:
+            leader, most_ships = -1, -1
+            for player_id in sorted(remaining_players):
+                ships = self.num_ships(player_id)
+                if ships == most_ships:
+                    leader = 0
+                elif ships > most_ships:
+                    leader, most_ships = player_id, ships
+            return max(leader, 0)
+        if not remaining_players:
+            return 0
+        if len(remaining_players) == 1:
+            return remaining_players.pop()
+        return -1
+
+
+def load_bot(bot_path):
+    """
+        Imports a bot script as a module so its do_turn can be called in-process. The script's own directory is put on
+        sys.path, the same as when the script is run by PlayGame.
+    """
+    bot_path = os.path.abspath(bot_path)
+    if bot_path not in _loaded_bots:
+        bot_dir = os.path.dirname(bot_path)
+        if bot_dir not in sys.path:
+            sys.path.insert(0, bot_dir)
+        name = os.path.splitext(os.path.basename(bot_path))[0]
+        spec = importlib.util.spec_from_file_location(name, bot_path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        _loaded_bots[bot_path] = module
+    return _loaded_bots[bot_path]
+
+
+def play_turn(bots, views, issue_order, max_turn_time, turn_time=1000, turn=0):
+    """
+        Plays one turn of a game: calls each bot's do_turn on its view, then applies their orders through
+        issue_order(player_id, source, destination, num_ships). A do_turn that raises is logged and the orders issued
+        before the error are still played, the same as bt_bot's main loop does under PlayGame.
+        max_turn_time is a [player 1, player 2] list of the slowest turns so far in ms, updated in place.
+        Returns (timed_out, crashed): the player dropped for going over turn_time or for an illegal order, or None.
+    """
+    for player_id, (module, view) in enumerate(zip(bots, views), 1):
+        start = perf_counter()
+        try:
+            module.do_turn(view)
+        except Exception:
+            logging.exception("Error in turn %d of bot %d.", turn, player_id)
+        elapsed = (perf_counter() - start) * 1000
+        max_turn_time[player_id - 1] = max(max_turn_time[player_id - 1], elapsed)
+        if turn_time is not None and elapsed > turn_time:
+            return player_id, None
+
+    for player_id, view in enumerate(views, 1):
+        if not all(issue_order(player_id, *order) for order in view.buffered_orders()):
+            return None, player_id
+    return None, None
+
+
+def play_match(bot, opponent_bot, map_path, max_turns=1000, turn_time=1000, observer=None):
+    """
+        Plays one game between two bot scripts on the given map.
+        turn_time is the per-turn budget in milliseconds (None for no limit). A bot that goes over it or issues an
+        illegal order loses the game, like it would under PlayGame (see play_turn).
+        observer, if given, is called with the Game at the start of every turn, before either bot moves.
+    """
+    bots = (load_bot(bot), load_bot(opponent_bot))
+    game = Game.from_map(map_path, max_turns)
+    get_blackboard().reset_game()
+
+    timed_out = crashed = None
+    max_turn_time = [0.0, 0.0]
+    winner = game.winner()
+    while winner < 0:
+        if observer is not None:
+            observer(game)
+        views = (game.player_view(1), game.player_view(2))
+        timed_out, crashed = play_turn(bots, views, game.issue_order, max_turn_time, turn_time, game.turn)
+        dropped = crashed or timed_out
+        if dropped:
+            winner = 3 - dropped
+            break
+        game.do_time_step()
+        winner = game.winner()
+
+    return MatchResult(winner, game.turn, timed_out, crashed, tuple(max_turn_time))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 4:
+        print('usage: python simulator.py <bot.py> <opponent_bot.py> <map.txt> [max_turns]')
+        sys.exit(1)
+    max_turns = int(sys.argv[4]) if len(sys.argv) > 4 else 1000
+    result = play_match(sys.argv[1], sys.argv[2], sys.argv[3], max_turns)
+    print(result)